@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+import columnar
+import config
+from model import TempModel, RainModel, WeatherTypeModel
+from store import FeatureStore
+
+
+# Benchmark harness for the model hot paths and the API routes
+#
+#   python bench.py --output bench.json                       # record results
+#   python bench.py --baseline bench.json --threshold 0.25    # fail on >25% regressions
+#
+# Model benchmarks run against copies of the bundled dataset scaled up by repeating
+# every row, as if each day were observed several times, so the predictions stay the
+# same while the data to load and search grows. The dataset is loaded both ways a
+# server can start: parsing the CSV (csv) and mapping its columnar copy (columnar)
+#
+# Route benchmarks run every route through the models, then again answered from the
+# forecast table (the [table] results)
+
+
+DATASET = 'new_merged_data.csv'
+
+
+# Write a copy of the dataset with its rows repeated `scale` times, returning its path
+# (also for scale 1, so the columnar copy made for the benchmark stays out of the tree)
+def scaled_dataset(scale, directory):
+    data = pd.read_csv(DATASET, index_col=0)
+    scaled = data.loc[data.index.repeat(scale)].reset_index(drop=True)
+
+    path = os.path.join(directory, f"dataset_x{scale}.csv")
+    scaled.to_csv(path)
+    return path
+
+
+# Time fn and summarize in milliseconds
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e3)
+    timings.sort()
+    return {
+        'median_ms': round(statistics.median(timings), 4),
+        'min_ms': round(timings[0], 4),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        'runs': repeat,
+    }
+
+
+def bench_models(scale, path, repeat):
+    results = {}
+    target = datetime.combine(date.today(), datetime.min.time())
+
+    # Parse the CSV, without the columnar copy
+    store = FeatureStore(path)
+    columnar_enabled = config.COLUMNAR
+    try:
+        config.COLUMNAR = False
+        results[f"store.load[csv,x{scale}]"] = measure(store.load, max(1, repeat // 10))
+    finally:
+        config.COLUMNAR = columnar_enabled
+
+    # Map the columnar copy, converted beforehand like the pipeline does
+    columnar.convert(path)
+    results[f"store.load[columnar,x{scale}]"] = measure(store.load, repeat)
+
+    temp_model = TempModel(store=store)
+    rain_model = RainModel(store=store)
+    weather_model = WeatherTypeModel(store=store)
+
+    results[f"TempModel.predict[x{scale}]"] = measure(lambda: temp_model.predict(target), repeat)
+
+    mintemp, temp9am, temp3pm, maxtemp = temp_model.predict(target)
+    results[f"TempModel.predict_hourly_temperatures[x{scale}]"] = measure(
+        lambda: temp_model.predict_hourly_temperatures(mintemp, temp9am, temp3pm, maxtemp, mintemp, mintemp), repeat)
+
+    # Clear the memoized totals so every run computes the month
+    def total_month():
+        rain_model.month_totals.clear()
+        rain_model.total_month(target)
+    results[f"RainModel.total_month[x{scale}]"] = measure(total_month, repeat)
+
+    for days in (7, 30, 90):
+        end = target + timedelta(days=days - 1)
+        results[f"WeatherTypeModel.predict[{days}d,x{scale}]"] = measure(
+            lambda: weather_model.predict(target, end), repeat)
+
+    return results
+
+
+# Time every route through an in-process client, with the response cache cleared
+# before each request so the prediction itself is measured: through the models with
+# the forecast table disabled, then from the forecast table
+def bench_routes(repeat):
+    from fastapi.testclient import TestClient
+    import main
+
+    results = {}
+    today = date.today()
+    target = today.isoformat()
+    month = [(today + timedelta(days=i)).isoformat() for i in range(31)]
+    end90 = (today + timedelta(days=89)).isoformat()
+
+    routes = {
+        'GET /predict/{date}': lambda c: c.get(f"/predict/{target}"),
+        'POST /predict': lambda c: c.post("/predict", json={'target_date': target}),
+        'GET /predict/hourly[31d]': lambda c: c.get("/predict/hourly", params={'start': month[0], 'end': month[-1]}),
+        'POST /predict_temp/monthly[31d]': lambda c: c.post("/predict_temp/monthly", json={'dates': month}),
+        'POST /predict_rain[31d]': lambda c: c.post("/predict_rain", json={'dates': month}),
+        'GET /predict_weather[90d]': lambda c: c.get(f"/predict_weather/{target}/{end90}"),
+        'POST /predict_weather[90d]': lambda c: c.post("/predict_weather", json={'startdate': target, 'enddate': end90}),
+    }
+
+    table_enabled = config.FORECAST_TABLE
+    try:
+        with TestClient(main.app) as client:
+            station = main.stations.default_station.load()
+            for table in (False, True):
+                config.FORECAST_TABLE = table
+                if table:
+                    station.forecast_tables.ensure()
+
+                for name, request in routes.items():
+                    def run():
+                        main.response_cache.clear()
+                        response = request(client)
+                        if response.status_code != 200:
+                            raise RuntimeError(f"{name} returned {response.status_code}: {response.text}")
+                    results[name + ('[table]' if table else '')] = measure(run, repeat)
+    finally:
+        config.FORECAST_TABLE = table_enabled
+
+    return results
+
+
+# Benchmarks whose median got slower than the baseline by more than threshold
+def regressions(results, baseline, threshold):
+    slower = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        ratio = result['median_ms'] / previous['median_ms'] if previous['median_ms'] else 1.0
+        if ratio > 1 + threshold:
+            slower.append((name, previous['median_ms'], result['median_ms'], ratio))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the models and API routes")
+    parser.add_argument('--scales', default='1,10,100,1000', help="dataset scale factors, comma separated")
+    parser.add_argument('--repeat', type=int, default=20, help="timed runs per benchmark")
+    parser.add_argument('--no-routes', action='store_true', help="skip the API route benchmarks")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare against results from a previous run")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in (int(value) for value in args.scales.split(',')):
+            path = scaled_dataset(scale, directory)
+            results.update(bench_models(scale, path, args.repeat))
+    if not args.no_routes:
+        results.update(bench_routes(args.repeat))
+
+    for name, result in results.items():
+        print(f"{name:<50} median {result['median_ms']:>10.3f} ms   p95 {result['p95_ms']:>10.3f} ms")
+
+    if args.output:
+        report = {
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'sklearn': sklearn.__version__,
+                'machine': platform.machine(),
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        slower = regressions(results, baseline, args.threshold)
+        for name, before, after, ratio in slower:
+            print(f"REGRESSION {name}: {before:.3f} ms -> {after:.3f} ms ({ratio:.2f}x)")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import hashlib
+import threading
+import time
+from datetime import date, datetime
+
+from metrics import span
+from serialize import dumps
+from utils import LRUCache
+
+
+# Normalize prediction inputs so that equivalent requests share a cache key
+def normalize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    return value
+
+
+# Cached prediction, with the rendered JSON body kept alongside the payload
+class CacheEntry:
+    def __init__(self, payload, body, expires, scope=None):
+        self.payload = payload
+        self.body = body
+        self.expires = expires
+        self.scope = scope
+
+
+# Bounded LRU/TTL cache of rendered prediction responses
+# Keys include the model and data version, and the entries of a scope (e.g. a station)
+# are dropped as soon as a new version is seen for it
+class ResponseCache:
+    def __init__(self, maxsize=256, ttl=300):
+        self.ttl = ttl
+        self.versions = {}
+        self._entries = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    # Cache key for a computation and its inputs under the given serving version
+    def key(self, name, args, version):
+        return repr((name, normalize(list(args)), version))
+
+    # Entity tag of the response for a key, known before the response is computed
+    # (the key holds the serving version, see cached_prediction)
+    def etag(self, key):
+        return '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+
+    def _check_version(self, version, scope):
+        if version != self.versions.get(scope):
+            with self._lock:
+                if version != self.versions.get(scope):
+                    if scope in self.versions:
+                        self._entries.discard(lambda entry: entry.scope == scope)
+                    self.versions[scope] = version
+
+    def get(self, key, version, scope=None):
+        self._check_version(version, scope)
+        entry = self._entries.get(key)
+        if entry is None or entry.expires < time.monotonic():
+            return None
+        return entry
+
+    def put(self, key, version, payload, scope=None):
+        self._check_version(version, scope)
+        with span('serialize'):
+            body = dumps(payload)
+        entry = CacheEntry(payload, body, time.monotonic() + self.ttl, scope)
+        self._entries.put(key, entry)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        self.versions.clear()
+
+    def __len__(self):
+        return len(self._entries)
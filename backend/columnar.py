@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy as np
+import pandas as pd
+
+import config
+from utils import file_sha256
+
+
+# Binary columnar format for the engineered dataset
+#
+#   magic (8 bytes) | header length (uint64, little endian) | JSON header | padding | column data
+#
+# The header holds the format version, the row count, the source the file was converted
+# from and the schema: name, dtype, offset and size of every column. Each column is a
+# contiguous little-endian array starting at a 64-byte aligned offset, so a memory-mapped
+# file gives zero-copy numpy views. Dates are stored as datetime64[ns] and text columns
+# as int32 codes into a list of categories kept in the header
+
+MAGIC = b'WCOLUMN\x00'
+FORMAT_VERSION = 1
+ALIGN = 64
+
+EXTENSION = '.wcol'
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+# Identity of a source file, to check that a converted file is up to date
+def source_stamp(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_sha256(path)}
+
+
+# Whether a source file still has the contents of its stamp
+# The file is only hashed when its size matches but it was modified since
+def source_matches(path, source):
+    stat = os.stat(path)
+    if source.get('size') != stat.st_size:
+        return False
+    return source.get('mtime_ns') == stat.st_mtime_ns or source.get('sha256') == file_sha256(path)
+
+
+# Path of the columnar copy of a CSV file
+def columnar_path(csv_path):
+    return os.path.splitext(csv_path)[0] + EXTENSION
+
+
+# Write a dataframe in the columnar format, atomically
+def write(data, path, source=None):
+    columns, arrays = [], []
+    offset = 0
+    for name in data.columns:
+        if name.startswith('Unnamed'):
+            continue
+        values = data[name]
+        column = {'name': name}
+        if pd.api.types.is_datetime64_any_dtype(values):
+            array = values.to_numpy(dtype='datetime64[ns]')
+        elif values.dtype.kind in 'biuf':
+            array = values.to_numpy()
+        else:
+            codes, categories = pd.factorize(values, use_na_sentinel=True)
+            array = codes.astype(np.int32)
+            column['categories'] = [str(category) for category in categories]
+
+        array = np.ascontiguousarray(array.astype(array.dtype.newbyteorder('<'), copy=False))
+        offset = _aligned(offset)
+        column.update({'dtype': array.dtype.str, 'offset': offset, 'nbytes': array.nbytes})
+        columns.append(column)
+        arrays.append(array)
+        offset += array.nbytes
+
+    header = json.dumps({
+        'version': FORMAT_VERSION,
+        'rows': len(data),
+        'index': 'Date' if 'Date' in data.columns else None,
+        'source': source,
+        'columns': columns,
+    }).encode()
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for column, array in zip(columns, arrays):
+            f.write(b'\0' * (data_start + column['offset'] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a columnar dataset")
+        length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length))
+    if header['version'] != FORMAT_VERSION:
+        raise ValueError(f"{path} has format version {header['version']}, expected {FORMAT_VERSION}")
+    header['data_start'] = _aligned(len(MAGIC) + 8 + length)
+    return header
+
+
+# Columns of a columnar file as numpy arrays, in file order
+# Numeric and date columns are views of the memory-mapped file; text columns are decoded
+def read(path, mmap=True):
+    header = read_header(path)
+    if mmap and os.path.getsize(path) > header['data_start']:
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        with open(path, 'rb') as f:
+            buffer = np.frombuffer(f.read(), dtype=np.uint8)
+
+    columns = {}
+    for column in header['columns']:
+        start = header['data_start'] + column['offset']
+        array = buffer[start:start + column['nbytes']].view(np.dtype(column['dtype']))
+        if 'categories' in column:
+            categories = np.array(column['categories'] + [np.nan], dtype=object)
+            array = categories[array]
+        columns[column['name']] = array
+    return columns, header
+
+
+# Write the columnar copy of a CSV file next to it
+def convert(csv_path, path=None):
+    path = path or columnar_path(csv_path)
+    source = source_stamp(csv_path)
+    data = pd.read_csv(csv_path)
+    if 'Date' in data.columns:
+        data['Date'] = pd.to_datetime(data['Date'], format='%Y-%m-%d')
+    write(data, path, source)
+    return path
+
+
+# Columnar copy of a CSV file if it was converted from the current contents of the file
+def current_columns(csv_path, mmap=True):
+    path = columnar_path(csv_path)
+    try:
+        header = read_header(path)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    try:
+        if not source_matches(csv_path, header.get('source') or {}):
+            return None
+    except FileNotFoundError:
+        pass
+    return read(path, mmap)[0]
+
+
+# Convert a CSV file unless its columnar copy is up to date, returning whether it was converted
+def convert_stale(csv_path):
+    if not os.path.exists(csv_path) or current_columns(csv_path, mmap=False) is not None:
+        return False
+    convert(csv_path)
+    return True
+
+
+# Load a CSV dataset, from its columnar copy when it is up to date, otherwise by parsing the CSV
+# Loading never writes the columnar copy: it is made by the pipeline, serve.py or this module
+# (rows keep the file order; the CSV index column is dropped and dates are parsed)
+def load_frame(csv_path, columnar=None):
+    if columnar is None:
+        columnar = config.COLUMNAR
+    if columnar:
+        columns = current_columns(csv_path)
+        if columns is not None:
+            return pd.DataFrame(columns, copy=False)
+
+    data = pd.read_csv(csv_path)
+    data = data.drop(columns=[name for name in data.columns if name.startswith('Unnamed')])
+    if 'Date' in data.columns:
+        data['Date'] = pd.to_datetime(data['Date'], format='%Y-%m-%d')
+    return data
+
+
+# Convert CSV datasets and compare load times
+def main():
+    parser = argparse.ArgumentParser(description="Convert CSV datasets to the columnar format")
+    parser.add_argument('paths', nargs='*', default=['new_merged_data.csv'])
+    args = parser.parse_args()
+
+    for csv_path in args.paths:
+        path = convert(csv_path)
+        expected = load_frame(csv_path, columnar=False)
+        actual = pd.DataFrame(read(path)[0])
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+        start = time.perf_counter()
+        pd.read_csv(csv_path)
+        csv_time = time.perf_counter() - start
+        start = time.perf_counter()
+        read(path)
+        columnar_time = time.perf_counter() - start
+        print(f"{csv_path} -> {path}: {len(expected)} rows, {os.path.getsize(csv_path)} -> {os.path.getsize(path)} bytes, "
+              f"load {csv_time * 1e3:.2f} ms -> {columnar_time * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+
+
+# Runtime settings for the API, overridable through environment variables
+
+# What to do at startup when the trained artifacts do not match the training data:
+# "load" serves the existing artifacts, "train" retrains them first
+BOOT_MODE = os.environ.get('WEATHER_BOOT_MODE', 'load')
+
+# Number of cores used to classify the weather types (-1 for all cores): threads evaluating
+# the trees of the pickled forest, or sharing the samples of a batch with the flat export
+RF_N_JOBS = int(os.environ.get('WEATHER_RF_N_JOBS', '1'))
+
+# Number of cores used to train the models: processes fitting the models concurrently,
+# and threads building the random forest trees (-1 for all cores)
+TRAIN_JOBS = int(os.environ.get('WEATHER_TRAIN_JOBS', '-1'))
+
+# Serve the random forest from its memory-mapped flat export (see forest.py) when it is up to date
+FLAT_FOREST = os.environ.get('WEATHER_FLAT_FOREST', '1') == '1'
+
+# Maximum number of days returned by one hourly temperature range request
+HOURLY_RANGE_MAX_DAYS = int(os.environ.get('WEATHER_HOURLY_RANGE_MAX_DAYS', '456'))
+
+# Pool that runs the blocking model work off the event loop: "thread" or "process"
+EXECUTOR_KIND = os.environ.get('WEATHER_EXECUTOR', 'thread')
+EXECUTOR_WORKERS = int(os.environ.get('WEATHER_EXECUTOR_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Number of predictions that may wait for a free worker before new requests get a 503
+EXECUTOR_MAX_QUEUE = int(os.environ.get('WEATHER_EXECUTOR_MAX_QUEUE', '64'))
+
+# Per-endpoint limits on running and queued predictions, e.g. "predict_weather=4,predict_rain=8"
+ENDPOINT_LIMITS = os.environ.get('WEATHER_ENDPOINT_LIMITS', '')
+
+# Number of prediction responses kept in memory, and for how many seconds
+# (also sent to clients as the Cache-Control max-age)
+RESPONSE_CACHE_SIZE = int(os.environ.get('WEATHER_RESPONSE_CACHE_SIZE', '256'))
+RESPONSE_CACHE_TTL = int(os.environ.get('WEATHER_RESPONSE_CACHE_TTL', '300'))
+
+# Days computed per chunk of a streamed (NDJSON) prediction
+STREAM_CHUNK_DAYS = int(os.environ.get('WEATHER_STREAM_CHUNK_DAYS', '7'))
+
+# Precompute the predictions for every day of the valid request window
+FORECAST_TABLE = os.environ.get('WEATHER_FORECAST_TABLE', '1') == '1'
+
+# Directory the forecast table is saved to and memory-mapped from (kept in memory only if empty)
+# Other stations keep theirs in a directory of the same name inside the station directory
+FORECAST_TABLE_PATH = os.environ.get('WEATHER_FORECAST_TABLE_PATH', '')
+
+# Set by serve.py for its workers: the artifacts, columnar data and forecast tables were
+# prepared by the parent process, so workers only attach to them
+PREPARED = os.environ.get('WEATHER_PREPARED', '0') == '1'
+
+# Load the engineered dataset from its memory-mapped columnar copy when it is up to date (see columnar.py)
+COLUMNAR = os.environ.get('WEATHER_COLUMNAR', '1') == '1'
+
+# Update the Ridge models from every batch of ingested observations (see online.py)
+ONLINE_TRAINING = os.environ.get('WEATHER_ONLINE_TRAINING', '1') == '1'
+
+# Directory holding one subdirectory of data and artifacts per additional station,
+# the default station being served from the backend directory itself
+STATIONS_PATH = os.environ.get('WEATHER_STATIONS_PATH', 'stations')
+DEFAULT_STATION = os.environ.get('WEATHER_DEFAULT_STATION', 'default')
+
+# Memory the loaded stations may take before the least recently used ones are evicted
+STATION_MEMORY_BUDGET = int(os.environ.get('WEATHER_STATION_MEMORY_MB', '512')) * 2 ** 20
+
+# Record per-stage and per-endpoint latency metrics, exposed on GET /metrics
+METRICS = os.environ.get('WEATHER_METRICS', '1') == '1'
+
+# Seconds clients are asked to wait before retrying a rejected request
+RETRY_AFTER = int(os.environ.get('WEATHER_RETRY_AFTER', '1'))
@@ -0,0 +1,92 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils import logger
+
+
+# Raised when a prediction cannot be queued, served as a 503 with Retry-After
+class ServiceOverloaded(Exception):
+    def __init__(self, endpoint, retry_after):
+        super().__init__(f"Too many pending predictions for {endpoint}")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+# Parse per-endpoint concurrency limits given as "endpoint=limit,endpoint=limit"
+def parse_limits(value):
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, limit = item.partition('=')
+        limits[name.strip()] = int(limit)
+    return limits
+
+
+# Runs blocking model work off the asyncio event loop
+# The pool only accepts a bounded number of pending tasks, in total and per endpoint,
+# and rejects anything beyond that straight away instead of letting the queue grow
+class PredictionExecutor:
+    def __init__(self, kind='thread', workers=4, max_queue=64, endpoint_limits=None, retry_after=1):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = workers + max_queue
+        self.endpoint_limits = dict(endpoint_limits or {})
+        self.retry_after = retry_after
+
+        self._pool = None
+        self._pending = 0
+        self._active = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    if self.kind == 'process':
+                        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='predict')
+        return self._pool
+
+    def _acquire(self, endpoint):
+        with self._lock:
+            limit = self.endpoint_limits.get(endpoint)
+            active = self._active.get(endpoint, 0)
+            if self._pending >= self.max_pending or (limit is not None and active >= limit):
+                logger.warning(f"Rejecting {endpoint} request: {self._pending} predictions pending")
+                raise ServiceOverloaded(endpoint, self.retry_after)
+            self._pending += 1
+            self._active[endpoint] = active + 1
+
+    def _release(self, endpoint):
+        with self._lock:
+            self._pending -= 1
+            self._active[endpoint] -= 1
+
+    # Run fn(*args) in the pool and wait for the result without blocking the event loop
+    # In process mode fn and its arguments must be picklable (module-level functions)
+    async def run(self, endpoint, fn, *args, **kwargs):
+        self._acquire(endpoint)
+        try:
+            future = self.pool.submit(functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self._release(endpoint)
+            raise
+
+        # Release the slot once the work has actually finished, even if the client went away
+        future.add_done_callback(lambda _: self._release(endpoint))
+        return await asyncio.wrap_future(future)
+
+    # Number of tasks running or waiting in the pool
+    @property
+    def pending(self):
+        return self._pending
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
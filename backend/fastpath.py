@@ -0,0 +1,124 @@
+import argparse
+import time
+
+import numpy as np
+
+
+# A fitted PolynomialFeatures (degree <= 2) + Ridge pair compiled into plain arrays
+# Each polynomial term is the product of two columns of the input padded with a column
+# of ones, so scoring is two gathers, a multiply and a dot product, with none of
+# sklearn's per-call validation
+class PolyRidge:
+    def __init__(self, left, right, coef, intercept):
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.n_features = int(max(self.left.max(), self.right.max()))
+
+    # Compile a fitted Ridge, optionally preceded by a fitted PolynomialFeatures
+    @classmethod
+    def from_sklearn(cls, ridge, poly=None):
+        n_features = ridge.n_features_in_ if poly is None else poly.n_features_in_
+        powers = np.eye(n_features, dtype=int) if poly is None else poly.powers_
+        if powers.sum(axis=1).max() > 2:
+            raise ValueError("Only polynomial features up to degree 2 can be compiled")
+
+        # Column n_features of the padded input is the constant 1
+        left = np.full(len(powers), n_features)
+        right = np.full(len(powers), n_features)
+        for term, power in enumerate(powers):
+            columns = np.repeat(np.arange(n_features), power)
+            if len(columns) > 0:
+                left[term] = columns[0]
+            if len(columns) > 1:
+                right[term] = columns[1]
+
+        return cls(left, right, ridge.coef_, ridge.intercept_)
+
+    # Score one row or a batch of rows, with the same output shape as Ridge.predict
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, but the model expects {self.n_features}")
+
+        padded = np.empty((X.shape[0], self.n_features + 1))
+        padded[:, :-1] = X
+        padded[:, -1] = 1.0
+        X_poly = padded[:, self.left] * padded[:, self.right]
+
+        return X_poly @ self.coef.T + self.intercept
+
+
+# Check that the compiled model scores X like the sklearn pipeline it was compiled from
+def verify(compiled, ridge, X, poly=None, rtol=1e-9, atol=1e-9):
+    X = np.asarray(X, dtype=np.float64)
+    expected = ridge.predict(X if poly is None else poly.transform(X))
+    actual = compiled.predict(X)
+    if expected.shape != actual.shape or not np.allclose(actual, expected, rtol=rtol, atol=atol):
+        raise AssertionError(f"Compiled model differs from sklearn by up to {np.max(np.abs(actual - expected))}")
+    return float(np.max(np.abs(actual - expected)))
+
+
+# Models that can be compiled: (ridge artifact, polynomial artifact, input columns)
+# The columns come from the model classes, which import this module, hence a function
+def compilable():
+    from model import TempModel, RainModel, WeatherTypeModel
+
+    return {
+        'temp': ('temp_model', 'polytemp_transformer', TempModel.INPUTS),
+        'rain': ('rain_model', 'polyrain_transformer', RainModel.INPUTS),
+        'features': ('rf_features_model', None, WeatherTypeModel.FEATURES_INPUTS),
+    }
+
+
+def best_time(fn, repeat=5, number=200):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return min(timings)
+
+
+# Compile the models, check them against sklearn on the dataset and time both paths
+# Serving compiles them from the loaded artifacts (see ModelBundle.derived), which takes
+# microseconds, so nothing is written to disk
+def main():
+    import warnings
+    from registry import model_registry
+    from store import feature_store
+
+    parser = argparse.ArgumentParser(description="Compile the Ridge models into plain coefficient arrays")
+    parser.add_argument('--no-bench', action='store_true', help="skip the timing comparison")
+    args = parser.parse_args()
+
+    bundle = model_registry.current()
+    snapshot = feature_store.snapshot()
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+    for name, (ridge_name, poly_name, columns) in compilable().items():
+        ridge = bundle[ridge_name]
+        poly = bundle[poly_name] if poly_name else None
+        compiled = PolyRidge.from_sklearn(ridge, poly)
+
+        X = np.column_stack([snapshot.columns[column] for column in columns])
+        error = verify(compiled, ridge, X, poly)
+        print(f"{name}: max difference from sklearn {error:.2e} over {len(X)} rows")
+
+        if not args.no_bench:
+            row = X[:1]
+            if poly is None:
+                sklearn_time = best_time(lambda: ridge.predict(row))
+            else:
+                sklearn_time = best_time(lambda: ridge.predict(poly.transform(row)))
+            fast_time = best_time(lambda: compiled.predict(row))
+            print(f"  single row: sklearn {sklearn_time * 1e6:.1f} us, compiled {fast_time * 1e6:.1f} us "
+                  f"({sklearn_time / fast_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+# Version of the feature engineering below
+# Bump it whenever the derived features change so that stale trained artifacts are detected
+FEATURES_VERSION = 1
+
+# Number of previous days averaged by the rolling features
+WINDOW = 7
+
+
+### Data Pre-processing for Model Training ###
+
+# Build on the merged dataset from Assignment 2
+# Add more features for an improved model more suitable/appropriate for web deployment
+def engineer_features(data):
+    data = data.copy()
+
+    # Extract Day and Month from Date
+    data['Date'] = pd.to_datetime(data.Date, format='%Y-%m-%d')
+    data['Day'] = data['Date'].dt.day
+    data['Month'] = data['Date'].dt.month
+
+    # Add more weather-specific rolling or lagged features
+    # Calculate weekly mean
+    data['MaxTemp_avg'] = data['MaxTemp'].rolling(WINDOW).mean().shift(1)
+    data['MinTemp_avg'] = data['MinTemp'].rolling(WINDOW).mean().shift(1)
+    data['Wind_avg'] = data['MaxWindSpeed'].rolling(WINDOW).mean().shift(1)
+    data['Cloud_avg'] = (data['9amCloud'] + data['3pmCloud']) / 2
+    data['Humidity_avg'] = (data['9amHumidity'] + data['3pmHumidity']) / 2
+
+    # Calculate previous day's data
+    data['PrevDayWind'] = data['MaxWindSpeed'].shift(1).fillna(0)
+    data['PrevDayPrecip'] = data['Precipitation'].shift(1).fillna(0)
+    data['PrevDayCloud'] = data['Cloud_avg'].shift(1).fillna(0)
+    data['PrevDaySunshine'] = data['Sunshine'].shift(1).fillna(0)
+    data['PrevDayHumidity'] = data['Humidity_avg'].shift(1).fillna(0)
+
+    # Compare given day's temperature with weekly mean
+    data['Week_Day_Max'] = data['MaxTemp_avg'] / data['MaxTemp']
+    data['Week_Day_Min'] = data['MinTemp_avg'] / data['MinTemp']
+
+    # Drop NaN values and reset index
+    data.dropna(inplace=True)
+    data.reset_index(drop=True, inplace=True)
+
+    return data
+
+
+# Streaming version of engineer_features for observations appended one at a time
+# Only the last WINDOW raw observations are kept, so each new row gets its rolling and
+# lagged features in O(WINDOW) instead of recomputing them over the whole dataset.
+# Rows that engineer_features would drop still count towards the features of the next ones
+class RollingFeatureState:
+    def __init__(self, history=()):
+        self.history = deque(history, maxlen=WINDOW)
+
+    # State after the given raw observations
+    @classmethod
+    def from_frame(cls, data):
+        return cls(data.tail(WINDOW).to_dict('records'))
+
+    def copy(self):
+        return RollingFeatureState(self.history)
+
+    # Mean of a column over the previous WINDOW observations, NaN until there are enough
+    def _mean(self, column):
+        if len(self.history) < WINDOW:
+            return np.nan
+        return np.mean([row[column] for row in self.history], dtype=np.float64)
+
+    # Value of the previous observation, 0 when it is missing
+    def _previous(self, value):
+        if not self.history:
+            return 0.0
+        value = value(self.history[-1])
+        return 0.0 if pd.isna(value) else value
+
+    # Add a raw observation and return its engineered row,
+    # or None if the row would be dropped by engineer_features
+    def update(self, row):
+        features = dict(row)
+        date = pd.to_datetime(row['Date'], format='%Y-%m-%d')
+        features['Date'] = date
+        features['Day'] = date.day
+        features['Month'] = date.month
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features['MaxTemp_avg'] = self._mean('MaxTemp')
+            features['MinTemp_avg'] = self._mean('MinTemp')
+            features['Wind_avg'] = self._mean('MaxWindSpeed')
+            features['Cloud_avg'] = _cloud_avg(row)
+            features['Humidity_avg'] = _humidity_avg(row)
+
+            features['PrevDayWind'] = self._previous(lambda previous: previous['MaxWindSpeed'])
+            features['PrevDayPrecip'] = self._previous(lambda previous: previous['Precipitation'])
+            features['PrevDayCloud'] = self._previous(_cloud_avg)
+            features['PrevDaySunshine'] = self._previous(lambda previous: previous['Sunshine'])
+            features['PrevDayHumidity'] = self._previous(_humidity_avg)
+
+            features['Week_Day_Max'] = np.float64(features['MaxTemp_avg']) / np.float64(row['MaxTemp'])
+            features['Week_Day_Min'] = np.float64(features['MinTemp_avg']) / np.float64(row['MinTemp'])
+
+        self.history.append(row)
+
+        if any(pd.isna(value) for value in features.values()):
+            return None
+        return features
+
+
+def _cloud_avg(row):
+    return (np.float64(row['9amCloud']) + np.float64(row['3pmCloud'])) / 2
+
+
+def _humidity_avg(row):
+    return (np.float64(row['9amHumidity']) + np.float64(row['3pmHumidity'])) / 2
+
+
+# Build the engineered dataset from the merged observations and save it
+def build_features(source='merged_data.csv', output='new_merged_data.csv'):
+    data = engineer_features(pd.read_csv(source))
+
+    # Save updated dataset, replacing the old file atomically
+    tmp_output = f"{output}.tmp.{os.getpid()}"
+    data.to_csv(tmp_output)
+    os.replace(tmp_output, output)
+
+    return data
@@ -0,0 +1,307 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils import file_lock, logger
+
+
+# Days a prediction may be requested for, relative to today (see PredictionInput)
+DAYS_BEFORE = 365
+DAYS_AFTER = 90
+
+# Per-day arrays held by the table
+ARRAYS = ['temps', 'hourly', 'rain', 'month_total', 'features', 'weather']
+
+
+# File locked in a table directory by the processes sharing it
+LOCK_FILE = '.lock'
+
+
+# Window of days the table should cover on a given day
+def window(today=None):
+    today = today or date.today()
+    return today - timedelta(days=DAYS_BEFORE), today + timedelta(days=DAYS_AFTER)
+
+
+# Compute every precomputed value for the given (contiguous) days
+def compute_days(days, temp_model, rain_model, weather_model, bundle):
+    if len(days) == 0:
+        return {
+            'temps': np.empty((0, 4)), 'hourly': np.empty((0, 25)), 'rain': np.empty(0),
+            'month_total': np.empty(0), 'features': np.empty((0, 7)), 'weather': np.empty(0, dtype=np.int16),
+        }
+
+    # Predict one extra day on each side for the 12am values of the hourly curves
+    with_neighbours = pd.date_range(start=days[0] - timedelta(days=1), end=days[-1] + timedelta(days=1))
+    temps = temp_model.predict_batch(with_neighbours, bundle=bundle)
+    hourly = np.round(temp_model.hourly_curves(temps[1:-1], temps[:-2, 0], temps[2:, 0]), 1)
+
+    rain = rain_model.predict_batch(days, bundle=bundle)
+    month_totals = {}
+    for day in days:
+        if (day.year, day.month) not in month_totals:
+            month_totals[(day.year, day.month)] = rain_model.total_month(day)
+    month_total = np.array([month_totals[(day.year, day.month)] for day in days])
+
+    features = weather_model.predict_features_batch(days, bundle=bundle)
+    classes = bundle['randomforest_model'].classes_
+    weather = np.searchsorted(classes, weather_model.classify(features, bundle=bundle)).astype(np.int16)
+
+    return {
+        'temps': temps[1:-1], 'hourly': hourly, 'rain': rain,
+        'month_total': month_total, 'features': features, 'weather': weather,
+    }
+
+
+# Predictions for every day of the valid request window, held in arrays indexed by day
+# so each endpoint can answer with an O(1) lookup
+class ForecastTable:
+    def __init__(self, start, arrays, classes, version):
+        self.start = pd.Timestamp(start)
+        self.arrays = arrays
+        self.classes = np.asarray(classes)
+        self.version = version
+
+    def __len__(self):
+        return len(self.arrays['temps'])
+
+    @property
+    def end(self):
+        return self.start + timedelta(days=len(self) - 1)
+
+    # Build the table for a window, reusing the days already held by a previous table
+    # built from the same models and data
+    @classmethod
+    def build(cls, start, end, temp_model, rain_model, weather_model, bundle, version, previous=None):
+        days = pd.date_range(start=start, end=end)
+        classes = bundle['randomforest_model'].classes_
+
+        reuse = (previous is not None and previous.version == version
+                 and np.array_equal(previous.classes, classes)
+                 and previous.start <= days[-1] and previous.end >= days[0])
+        if not reuse:
+            arrays = compute_days(days, temp_model, rain_model, weather_model, bundle)
+            return cls(days[0], arrays, classes, version)
+
+        # Only compute the days that slid into the window
+        kept_start = max(previous.start, days[0])
+        kept_end = min(previous.end, days[-1])
+        first = (kept_start - previous.start).days
+        last = (kept_end - previous.start).days + 1
+
+        before = compute_days(pd.date_range(start=days[0], end=kept_start - timedelta(days=1)),
+                              temp_model, rain_model, weather_model, bundle)
+        after = compute_days(pd.date_range(start=kept_end + timedelta(days=1), end=days[-1]),
+                             temp_model, rain_model, weather_model, bundle)
+        arrays = {
+            name: np.concatenate([before[name], previous.arrays[name][first:last], after[name]])
+            for name in ARRAYS
+        }
+        return cls(days[0], arrays, classes, version)
+
+    # Row of each date in the table, or None if any of them is not covered
+    # Only whole days are precomputed, dates with a time of day go through the models
+    def rows(self, dates):
+        rows = []
+        for value in dates:
+            timestamp = pd.Timestamp(value)
+            if timestamp != timestamp.normalize():
+                return None
+            row = (timestamp - self.start).days
+            if row < 0 or row >= len(self):
+                return None
+            rows.append(row)
+        return np.array(rows, dtype=np.intp)
+
+    def covers(self, dates):
+        return self.rows(dates) is not None
+
+    def temps(self, dates):
+        return self.arrays['temps'][self.rows(dates)]
+
+    def rain(self, dates):
+        return self.arrays['rain'][self.rows(dates)]
+
+    def month_total(self, dates):
+        return self.arrays['month_total'][self.rows(dates)]
+
+    # Hourly curves of each date, rounded to 1 decimal
+    def hourly(self, dates):
+        return self.arrays['hourly'][self.rows(dates)]
+
+    # Same response as TempModel.predict_hourly_range for one day
+    def hourly_prediction(self, target_date):
+        row = self.rows([target_date])[0]
+        mintemp, temp9am, temp3pm, maxtemp = self.arrays['temps'][row]
+        return {
+            "date": target_date,
+            "predicted_mintemp": round(mintemp, 1),
+            "predicted_maxtemp": round(maxtemp, 1),
+            "hourly_temperatures": [{"hour": hour, "temperature": temp}
+                                    for hour, temp in enumerate(self.arrays['hourly'][row].tolist())],
+        }
+
+    # Same counts as Counter(WeatherTypeModel.predict(startdate, enddate))
+    def weather_counts(self, startdate, enddate):
+        rows = self.rows(pd.date_range(start=startdate, end=enddate))
+        return dict(Counter(self.classes[self.arrays['weather'][rows]].tolist()))
+
+    # Weather type of each date
+    def weather_types(self, dates):
+        return self.classes[self.arrays['weather'][self.rows(dates)]]
+
+    # Save the arrays as .npy files that can be memory-mapped by load(), in a directory of
+    # their own inside path, and remove the older builds
+    # The caller holds the exclusive lock of path (see locked), so no other process is
+    # opening a build meanwhile; processes that already mapped an old build keep reading it
+    def save(self, path):
+        build_id = uuid.uuid4().hex[:8]
+        os.makedirs(os.path.join(path, build_id))
+        for name in ARRAYS:
+            np.save(os.path.join(path, build_id, f"{name}.npy"), np.ascontiguousarray(self.arrays[name]))
+
+        meta = {
+            'build_id': build_id,
+            'start': self.start.date().isoformat(),
+            'classes': self.classes.tolist(),
+            'version': self.version,
+            'built_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        # The metadata is replaced last, so readers always find a complete table
+        tmp_path = os.path.join(path, f"meta.json.tmp.{os.getpid()}")
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+        # Remove the older builds
+        for entry in os.listdir(path):
+            if entry != build_id and os.path.isdir(os.path.join(path, entry)):
+                shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+    # Table last saved to path, under the shared lock so the build is not removed while it is opened
+    @classmethod
+    def load(cls, path, mmap=True):
+        if not os.path.isdir(path):
+            return None
+        with locked(path, exclusive=False):
+            return cls.read(path, mmap)
+
+    # Table last saved to path, for callers already holding its lock
+    @classmethod
+    def read(cls, path, mmap=True):
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            arrays = {
+                name: np.load(os.path.join(path, meta['build_id'], f"{name}.npy"), mmap_mode='r' if mmap else None)
+                for name in ARRAYS
+            }
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+        return cls(meta['start'], arrays, meta['classes'], meta['version'])
+
+
+# Lock on a table directory shared by several processes (the workers of serve.py)
+# Held exclusively to build and save a table, shared to open one
+@contextmanager
+def locked(path, exclusive):
+    os.makedirs(path, exist_ok=True)
+    with file_lock(os.path.join(path, LOCK_FILE), exclusive):
+        yield
+
+
+# Keeps the forecast table in step with the date window and the serving version
+# Stale tables are refreshed in a background thread, requests never wait for a build
+# With a path, the processes sharing it take turns under its lock: the first to find the
+# saved table stale builds and saves it, the others map the saved table instead of building
+# their own, so they all share the pages of the same files
+class ForecastTableManager:
+    def __init__(self, temp_model, rain_model, weather_model, registry, version, path=None):
+        self.temp_model = temp_model
+        self.rain_model = rain_model
+        self.weather_model = weather_model
+        self.registry = registry
+        self.version = version
+        self.path = path
+
+        self.table = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+        if path:
+            self.table = ForecastTable.load(path)
+
+    def _stale(self, table, version):
+        return table is None or table.version != version or table.start.date() != window()[0]
+
+    # Build or slide the table right away
+    def refresh(self):
+        if not self.path:
+            table = self._build(self.table)
+            if table is not None:
+                self.table = table
+            return self.table
+
+        with locked(self.path, exclusive=True):
+            # Another process may have saved a current table while this one waited for the lock
+            saved = ForecastTable.read(self.path)
+            if not self._stale(saved, self.version()):
+                self.table = saved
+                return saved
+
+            table = self._build(saved if saved is not None else self.table)
+            if table is not None:
+                table.save(self.path)
+                # Serve the saved arrays rather than the built ones, so the pages are shared
+                self.table = ForecastTable.read(self.path)
+        return self.table
+
+    # Build the table, reusing the days of previous
+    # Returns None if the models or data changed while it was being built
+    def _build(self, previous):
+        bundle = self.registry.current()
+        version = self.version()
+        start, end = window()
+
+        table = ForecastTable.build(start, end, self.temp_model, self.rain_model, self.weather_model,
+                                    bundle, version, previous=previous)
+        if self.version() != version:
+            return None
+
+        logger.info(f"Forecast table refreshed: {len(table)} days from {table.start.date()}, version {version}")
+        return table
+
+    # Build the table right away only if it is missing or stale
+    def ensure(self):
+        if self._stale(self.table, self.version()):
+            return self.refresh()
+        return self.table
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Error refreshing forecast table: {str(e)}")
+        finally:
+            self._refreshing = False
+
+    # Table matching the current serving version, or None while it is being (re)built
+    # A table for the right version is still served while the window slides
+    def current(self, version):
+        table = self.table
+        if self._stale(table, version):
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        if table is None or table.version != version:
+            return None
+        return table
@@ -0,0 +1,231 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+import tracemalloc
+
+import joblib
+import numpy as np
+
+from utils import logger
+
+
+# Directory the flattened random forest is exported to
+FLAT_FOREST_PATH = 'randomforest_flat'
+
+ARRAYS = ['feature', 'threshold', 'left', 'right', 'value', 'roots']
+
+# Samples each thread gets at least when a batch is split across threads
+MIN_ROWS_PER_JOB = 32
+
+
+# A fitted RandomForestClassifier flattened into contiguous node arrays
+# All the trees are stored back to back: leaves point to themselves, so a batch of
+# samples can walk every tree at once for max_depth steps
+class FlatForest:
+    def __init__(self, feature, threshold, left, right, value, roots, classes, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = np.asarray(classes)
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(feature.max()) + 1 if len(feature) else 0
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        if forest.n_outputs_ != 1:
+            raise ValueError("Only single-output forests can be flattened")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left == -1
+
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, 0.0, tree.threshold))
+            lefts.append(np.where(leaf, nodes, tree.children_left) + offset)
+            rights.append(np.where(leaf, nodes, tree.children_right) + offset)
+
+            # Class probabilities of every node, normalized like DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :].copy()
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(proba / normalizer)
+
+            roots.append(offset)
+            offset += tree.node_count
+
+        return cls(
+            np.concatenate(features).astype(np.int32),
+            np.concatenate(thresholds).astype(np.float64),
+            np.concatenate(lefts).astype(np.int32),
+            np.concatenate(rights).astype(np.int32),
+            np.concatenate(values).astype(np.float64),
+            np.array(roots, dtype=np.int32),
+            forest.classes_,
+            max(estimator.tree_.max_depth for estimator in forest.estimators_),
+        )
+
+    # Leaf reached in every tree by every sample, as an (n_samples, n_trees) array
+    def apply(self, X):
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+
+        nodes = np.repeat(self.roots[np.newaxis, :], X.shape[0], axis=0)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    # Samples are independent, so a large batch is split by rows across the threads of the
+    # joblib configuration in effect (parallel_config(n_jobs=...)); every chunk accumulates
+    # the trees in the same order, so the result does not depend on the split
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        n_jobs = min(joblib.effective_n_jobs(None), X.shape[0] // MIN_ROWS_PER_JOB)
+        if n_jobs < 2:
+            return self._predict_proba(X)
+        chunks = np.array_split(X, n_jobs)
+        return np.vstack(joblib.Parallel(n_jobs=n_jobs, prefer='threads')(
+            joblib.delayed(self._predict_proba)(chunk) for chunk in chunks))
+
+    def _predict_proba(self, X):
+        leaves = self.apply(X)
+
+        # Accumulate tree by tree, in the same order as RandomForestClassifier,
+        # so ties are broken the same way
+        proba = np.zeros((leaves.shape[0], self.value.shape[1]))
+        for tree in range(leaves.shape[1]):
+            proba += self.value[leaves[:, tree]]
+        proba /= leaves.shape[1]
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    # Save the node arrays as .npy files that can be memory-mapped by load()
+    # source_sha256 identifies the pickled forest the export was made from
+    def save(self, path, source_sha256):
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+
+        meta = {
+            'source_sha256': source_sha256,
+            'classes': self.classes_.tolist(),
+            'max_depth': self.max_depth,
+        }
+        # The metadata is replaced last, so a partial export is never considered current
+        tmp_path = os.path.join(path, f"meta.json.tmp.{os.getpid()}")
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r' if mmap else None) for name in ARRAYS]
+        return cls(*arrays, meta['classes'], meta['max_depth']), meta
+
+
+# Registry loader for the pickled forest
+# Uses the memory-mapped flat export when it was made from the same pickle,
+# and falls back to unpickling it otherwise
+def load_classifier(path, content, flat_path=FLAT_FOREST_PATH):
+    source_sha256 = hashlib.sha256(content).hexdigest()
+    try:
+        forest, meta = FlatForest.load(flat_path)
+        if meta['source_sha256'] == source_sha256:
+            return forest
+        logger.warning(f"Flat forest export in {flat_path} is stale, loading {path} instead")
+    except FileNotFoundError:
+        pass
+    return joblib.load(io.BytesIO(content))
+
+
+# Flatten the pickled forest and save it next to it
+def export(source='randomforest_model.pkl', path=FLAT_FOREST_PATH):
+    with open(source, 'rb') as f:
+        content = f.read()
+    forest = joblib.load(io.BytesIO(content))
+    flat = FlatForest.from_sklearn(forest)
+    flat.save(path, hashlib.sha256(content).hexdigest())
+    return forest, flat
+
+
+# Check that the flat forest classifies X like the sklearn forest
+def verify(flat, forest, X):
+    X = np.asarray(X, dtype=np.float64)
+    expected = forest.predict(X)
+    actual = flat.predict(X)
+    mismatches = int(np.sum(expected != actual))
+    if mismatches:
+        raise AssertionError(f"Flat forest differs from sklearn on {mismatches} of {len(X)} samples")
+    return np.max(np.abs(flat.predict_proba(X) - forest.predict_proba(X)))
+
+
+def measure_load(load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    model = load()
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return model, elapsed, memory
+
+
+def main():
+    import warnings
+    from model import WeatherTypeModel
+    from store import feature_store
+
+    parser = argparse.ArgumentParser(description="Export the random forest as memory-mappable node arrays")
+    parser.add_argument('--source', default='randomforest_model.pkl')
+    parser.add_argument('--output', default=FLAT_FOREST_PATH)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    forest, flat = export(args.source, args.output)
+    print(f"Exported {len(forest.estimators_)} trees ({len(flat.feature)} nodes) to {args.output}")
+
+    # Compare on the observed weather and on random samples spread over the observed ranges
+    snapshot = feature_store.snapshot()
+    columns = WeatherTypeModel.INPUTS
+    observed = np.column_stack([snapshot.columns[column] for column in columns])
+    rng = np.random.default_rng(42)
+    synthetic = rng.uniform(observed.min(axis=0), observed.max(axis=0), size=(10000, len(columns)))
+    for name, X in (('observed', observed), ('synthetic', synthetic)):
+        error = verify(flat, forest, X)
+        print(f"{name}: {len(X)} samples classified identically, max probability difference {error:.2e}")
+
+    _, pickle_time, pickle_memory = measure_load(lambda: joblib.load(args.source))
+    _, flat_time, flat_memory = measure_load(lambda: FlatForest.load(args.output))
+    print(f"load: pickle {pickle_time * 1e3:.1f} ms / {pickle_memory / 1024:.0f} KiB, "
+          f"flat {flat_time * 1e3:.1f} ms / {flat_memory / 1024:.0f} KiB")
+
+    X = synthetic[:90]
+    start = time.perf_counter()
+    forest.predict(X)
+    sklearn_time = time.perf_counter() - start
+    start = time.perf_counter()
+    flat.predict(X)
+    flat_time = time.perf_counter() - start
+    print(f"90-day batch: sklearn {sklearn_time * 1e3:.2f} ms, flat {flat_time * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import csv
+import os
+import threading
+
+import pandas as pd
+
+from features import WINDOW, RollingFeatureState
+from pipeline import SOURCE_DATA
+from store import feature_store
+from utils import file_lock, logger
+
+
+# Observation columns that hold text, every other column is numeric
+TEXT_COLUMNS = {'Date', 'MaxWindDir', 'MaxWindTime', '9amWindDir', '3pmWindDir', 'WeatherType'}
+
+
+# Column names from the header line of a CSV file
+def read_header(path):
+    with open(path, newline='') as f:
+        return next(csv.reader(f))
+
+
+# Append rows to a CSV file in the order of its header, without rewriting it
+def append_csv(path, rows, header, index=None):
+    frame = pd.DataFrame(rows, columns=header, index=index)
+    with open(path, 'a', newline='') as f:
+        frame.to_csv(f, header=False, index=index is not None)
+
+
+# Appends new daily observations to the merged dataset and to the serving dataset
+# Their rolling and lagged features are computed incrementally from the last few
+# observations, and the engineered rows are added straight to the feature store
+# Processes sharing the datasets (the workers of serve.py) ingest in turn under a lock
+# file next to the merged dataset, each catching up with the rows the others appended
+class ObservationLog:
+    def __init__(self, source=SOURCE_DATA, store=feature_store):
+        self.source = source
+        self.store = store
+        self.lock_path = f"{source}.lock"
+        self._state = None
+        self._source_stamp = None
+        self._lock = threading.Lock()
+
+        # Functions called with the engineered rows of every ingested batch
+        self.listeners = []
+
+    # Rolling state after the latest observation, read from the merged dataset on first use
+    # and again whenever another process appended to it
+    def state(self):
+        stamp = self._file_stamp()
+        if self._state is None or stamp != self._source_stamp:
+            data = pd.read_csv(self.source)
+            self._state = RollingFeatureState.from_frame(data.tail(WINDOW))
+            self._source_stamp = stamp
+        return self._state
+
+    def _file_stamp(self):
+        stat = os.stat(self.source)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    # Check an observation against the merged dataset columns
+    def _validate(self, observation, header):
+        missing = [column for column in header if column not in observation]
+        if missing:
+            raise ValueError(f"Observation is missing fields: {', '.join(missing)}")
+
+        row = {}
+        for column in header:
+            value = observation[column]
+            if column == 'Date':
+                value = pd.to_datetime(value, format='%Y-%m-%d').strftime('%Y-%m-%d')
+            elif column not in TEXT_COLUMNS and value is not None and not isinstance(value, (int, float)):
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    raise ValueError(f"Observation field {column} must be a number, got {value!r}") from None
+            row[column] = value
+        return row
+
+    # Append observations, given as dicts with the merged dataset columns, in date order
+    # Returns how many rows were added to the serving dataset and the new data version
+    def append(self, observations):
+        with self._lock, file_lock(self.lock_path):
+            header = read_header(self.source)
+            rows = [self._validate(observation, header) for observation in observations]
+            if not rows:
+                return {"observations": 0, "rows_added": 0, "version": self.store.version}
+
+            state = self.state().copy()
+            last = pd.to_datetime(state.history[-1]['Date'], format='%Y-%m-%d') if state.history else None
+            for row in rows:
+                date = pd.to_datetime(row['Date'], format='%Y-%m-%d')
+                if last is not None and date <= last:
+                    raise ValueError(f"Observation for {row['Date']} is not after the latest observation")
+                last = date
+
+            # Features of the new rows, from the previous observations only
+            engineered = [features for features in map(state.update, rows) if features is not None]
+
+            # Check the new rows against the serving data, reloaded with the rows other
+            # processes appended, before writing to either file
+            added = pd.DataFrame(engineered)
+            snapshot = self.store.refresh()
+            if engineered:
+                self.store.check_append(added, snapshot)
+
+            append_csv(self.source, rows, header)
+            if engineered:
+                # A serving dataset written by pandas starts with its index column,
+                # continued from the rows already in the store
+                output_header, index = read_header(self.store.path), None
+                if output_header[0] == '' or output_header[0].startswith('Unnamed'):
+                    start = len(snapshot.dates)
+                    output_header, index = output_header[1:], range(start, start + len(engineered))
+                append_csv(self.store.path, engineered, output_header, index=index)
+                self.store.append(added, snapshot)
+
+            self._state = state
+            self._source_stamp = self._file_stamp()
+
+        # The rows are already ingested, so a failing listener does not fail the request
+        for listener in self.listeners:
+            try:
+                listener(added)
+            except Exception as e:
+                logger.error(f"Observation listener failed: {str(e)}")
+
+        logger.info(f"Ingested {len(rows)} observations, {len(engineered)} rows added to the serving data")
+        return {"observations": len(rows), "rows_added": len(engineered), "version": self.store.version}
@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import httpx
+
+
+# Load generator replaying the frontend's request pattern against a local API server
+#
+#   python loadtest.py --users 1,10,50 --ramp 5 --duration 30           # start uvicorn, step through the user counts
+#   python loadtest.py --workers 4 --output load.json                   # 4 uvicorn workers, write the results
+#   python loadtest.py --url http://localhost:8000 --users 20           # test a server that is already running
+#   python loadtest.py --env WEATHER_EXECUTOR=process --env WEATHER_RESPONSE_CACHE_SIZE=0
+#
+# Every simulated user repeatedly picks a date and fetches what the frontend fetches when
+# the date changes (see App.js, TemperaturePage.js and WeatherTypePage.js): the POST
+# /predict validation, the day's GET /predict/{date}, a concurrent burst of GET
+# /predict/{date} for the same day of the 3 months before and after, the monthly
+# temperature and rain charts, and the weather type chart. Users are started at --ramp
+# users per second, each with its own connection pool limited like a browser's
+
+
+# Concurrent connections a browser opens to one host
+BROWSER_CONNECTIONS = 6
+
+# Days a date may be picked from, relative to today (see PredictionInput)
+DAYS_BEFORE = 365
+DAYS_AFTER = 90
+
+
+# Same day some months later, or the last day of that month (addMonths in date-fns)
+def add_months(day, months):
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, monthrange(year, month)[1]))
+
+
+# Same day of the 3 months before and after the target date (createDateRange in App.js)
+def month_range(target):
+    return [add_months(target, months).isoformat() for months in range(-3, 4)]
+
+
+# Latencies and errors of the requests to each endpoint
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.sessions = 0
+
+    def record(self, endpoint, latency, status):
+        self.latencies[endpoint].append(latency)
+        self.statuses[endpoint][status] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors[endpoint] += 1
+
+
+class User:
+    def __init__(self, base_url, recorder, rng, think_time):
+        self.recorder = recorder
+        self.rng = rng
+        self.think_time = think_time
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=60,
+                                        limits=httpx.Limits(max_connections=BROWSER_CONNECTIONS))
+
+    async def request(self, endpoint, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.recorder.record(endpoint, time.perf_counter() - start, status)
+        return status
+
+    # The requests made for one change of date
+    async def session(self):
+        today = date.today()
+        target = today + timedelta(days=self.rng.randint(-DAYS_BEFORE + 1, DAYS_AFTER - 1))
+        dates = month_range(target)
+
+        # Temperature page: validate, then the target day and the burst of days around it
+        await self.request("POST /predict", "POST", "/predict", json={"target_date": target.isoformat()})
+        await self.request("GET /predict/{date}", "GET", f"/predict/{target.isoformat()}")
+        await asyncio.gather(*(self.request("GET /predict/{date}", "GET", f"/predict/{day}") for day in dates))
+
+        # Monthly temperature and rain charts
+        await self.request("POST /predict_temp/monthly", "POST", "/predict_temp/monthly", json={"dates": dates})
+        await self.request("POST /predict_rain", "POST", "/predict_rain", json={"dates": dates})
+
+        # Weather type chart for a range starting at the target date
+        end = min(target + timedelta(days=self.rng.randint(7, 60)), today + timedelta(days=DAYS_AFTER - 1))
+        span = {"startdate": target.isoformat(), "enddate": end.isoformat()}
+        await self.request("POST /predict_weather", "POST", "/predict_weather", json=span)
+        await self.request("GET /predict_weather/{startdate}/{enddate}", "GET",
+                           f"/predict_weather/{span['startdate']}/{span['enddate']}")
+        self.recorder.sessions += 1
+
+    async def run(self, deadline):
+        try:
+            while time.perf_counter() < deadline:
+                await self.session()
+                if self.think_time:
+                    await asyncio.sleep(self.rng.expovariate(1 / self.think_time))
+        finally:
+            await self.client.aclose()
+
+
+# Nearest-rank percentile of sorted values
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(recorder, elapsed):
+    endpoints = {}
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        latencies = sorted(latencies)
+        endpoints[endpoint] = {
+            'requests': len(latencies),
+            'errors': recorder.errors[endpoint],
+            'error_rate': round(recorder.errors[endpoint] / len(latencies), 4),
+            'throughput_rps': round(len(latencies) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 0.50) * 1e3, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1e3, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1e3, 2),
+            'statuses': {str(status): count for status, count in recorder.statuses[endpoint].items()},
+        }
+
+    requests = sum(result['requests'] for result in endpoints.values())
+    errors = sum(result['errors'] for result in endpoints.values())
+    return {
+        'elapsed_s': round(elapsed, 2),
+        'sessions': recorder.sessions,
+        'requests': requests,
+        'errors': errors,
+        'error_rate': round(errors / requests, 4) if requests else 0.0,
+        'throughput_rps': round(requests / elapsed, 2),
+        'endpoints': endpoints,
+    }
+
+
+# Run `users` users for `duration` seconds, starting `ramp` of them per second
+# Sessions still running at the deadline are completed and counted
+async def run_stage(base_url, users, ramp, duration, think_time, seed):
+    recorder = Recorder()
+    start = time.perf_counter()
+    deadline = start + duration
+
+    tasks = []
+    for i in range(users):
+        if ramp and i:
+            await asyncio.sleep(1 / ramp)
+        if time.perf_counter() >= deadline:
+            break
+        user = User(base_url, recorder, random.Random(seed * 100003 + i), think_time)
+        tasks.append(asyncio.create_task(user.run(deadline)))
+    await asyncio.gather(*tasks)
+
+    result = summarize(recorder, time.perf_counter() - start)
+    result['users'] = len(tasks)
+    return result
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Start uvicorn on the backend in a subprocess and wait until it answers
+# Its output goes to log_path, so the prediction logs do not drown the report
+def start_server(port, workers, env, log_path=os.devnull, timeout=120):
+    command = [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+               '--workers', str(workers), '--log-level', 'warning']
+    with open(log_path, 'ab') as log:
+        process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env={**os.environ, **env},
+                                   stdout=log, stderr=subprocess.STDOUT)
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with code {process.returncode}, see --server-log")
+        try:
+            if httpx.get(url + "/", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"The server did not start within {timeout}s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def print_stage(result):
+    print(f"\n{result['users']} users: {result['sessions']} sessions, {result['requests']} requests in {result['elapsed_s']}s, "
+          f"{result['throughput_rps']} req/s, error rate {result['error_rate']:.2%}")
+    for endpoint, stats in result['endpoints'].items():
+        print(f"  {endpoint:<42} {stats['requests']:>7} req {stats['throughput_rps']:>8.2f}/s   "
+              f"p50 {stats['p50_ms']:>9.2f} ms   p95 {stats['p95_ms']:>9.2f} ms   p99 {stats['p99_ms']:>9.2f} ms   "
+              f"errors {stats['error_rate']:.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the frontend's request pattern against the API")
+    parser.add_argument('--users', default='1,10,50', help="concurrent users of each stage, comma separated")
+    parser.add_argument('--ramp', type=float, default=10, help="users started per second, 0 to start them all at once")
+    parser.add_argument('--duration', type=float, default=30, help="seconds each stage starts new sessions for")
+    parser.add_argument('--think-time', type=float, default=1.0, help="mean seconds between a user's sessions")
+    parser.add_argument('--url', help="test the server at this URL instead of starting one")
+    parser.add_argument('--port', type=int, help="port of the started server (default: a free port)")
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn workers of the started server")
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help="environment variable for the started server, e.g. WEATHER_EXECUTOR=process")
+    parser.add_argument('--server-log', default=os.devnull, help="file the started server's output is appended to")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the dates the users pick")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    env = dict(value.split('=', 1) for value in args.env)
+    process = None
+    if args.url:
+        url = args.url.rstrip('/')
+    else:
+        process, url = start_server(args.port or free_port(), args.workers, env, args.server_log)
+
+    stages = []
+    try:
+        for users in (int(value) for value in args.users.split(',')):
+            result = asyncio.run(run_stage(url, users, args.ramp, args.duration, args.think_time, args.seed))
+            print_stage(result)
+            stages.append(result)
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    if args.output:
+        report = {
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'url': args.url,
+                'workers': None if args.url else args.workers,
+                'env': env,
+                'ramp': args.ramp,
+                'duration_s': args.duration,
+                'think_time_s': args.think_time,
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+            },
+            'stages': stages,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
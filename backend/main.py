@@ -1,12 +1,21 @@
-from fastapi import FastAPI,HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from model import TempModel, RainModel, WeatherTypeModel
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from executor import PredictionExecutor, ServiceOverloaded, parse_limits
+from cache import ResponseCache
+from singleflight import SingleFlight
+from stations import Station, UnknownStation, stations
+import metrics
+import pipeline
+import serialize
 from pydantic import BaseModel, Field, validator
 from utils import logger
 from datetime import datetime, timedelta
 from collections import Counter
 import numpy as np
-from typing import List
+from typing import Any, Dict, List, Literal
+import config
 
 
 app = FastAPI()
@@ -20,16 +29,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the models
-temp_model = TempModel()
-rain_model = RainModel()
-weather_model = WeatherTypeModel()
+# Count requests, errors and in-flight requests per endpoint
+if metrics.ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# Pool running the blocking model work off the event loop
+executor = PredictionExecutor(
+    kind=config.EXECUTOR_KIND,
+    workers=config.EXECUTOR_WORKERS,
+    max_queue=config.EXECUTOR_MAX_QUEUE,
+    endpoint_limits=parse_limits(config.ENDPOINT_LIMITS),
+    retry_after=config.RETRY_AFTER,
+)
 
-# Ensure models are trained
-temp_model.train()
-rain_model.train()
-weather_model.train()
-weather_model.train_features()
+# Cache of rendered prediction responses
+response_cache = ResponseCache(maxsize=config.RESPONSE_CACHE_SIZE, ttl=config.RESPONSE_CACHE_TTL)
+
+# Coalesce identical concurrent requests, and identical monthly rain totals inside them
+# Range endpoints are not split into per-day flights: their days are scored in one
+# vectorized batch, and one day costs over half as much as a whole month (about 0.13 ms
+# against 0.22 ms for the temperatures, 1.3 ms against 2.4 ms for the weather types), so
+# waiting on other requests day by day would cost more than it saves. Overlapping date
+# ranges inside the request window are answered from the forecast table instead
+request_flights = SingleFlight("requests")
+month_flights = SingleFlight("rain_months")
+
+# Load the pretrained models of the default station when the server starts
+# Training is an explicit step (`python pipeline.py`) unless WEATHER_BOOT_MODE=train
+# Other stations are loaded on their first request
+# Workers started by serve.py attach to what the parent prepared instead
+@app.on_event("startup")
+def load_models():
+    if not config.PREPARED:
+        pipeline.prepare(config.BOOT_MODE)
+    station = stations.default_station.load()
+    if config.FORECAST_TABLE and not config.PREPARED:
+        station.forecast_tables.refresh()
+
+@app.on_event("shutdown")
+def stop_executor():
+    executor.shutdown(wait=False)
+    stations.close()
+
+# Station selected by the location query parameter of every endpoint
+# A plain function, so a station loaded on first use is read from disk in the threadpool
+def station_for(location: str = Query(config.DEFAULT_STATION, description="Weather station")):
+    try:
+        return stations.get(location)
+    except UnknownStation as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+# Reject requests with a 503 when the prediction queue is full
+@app.exception_handler(ServiceOverloaded)
+async def service_overloaded_handler(request, exc):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 class PredictionInput(BaseModel):
     # Field defines constraints for input validation
@@ -49,6 +106,10 @@ class PredictionInput(BaseModel):
 class MonthlyPredictionInput(BaseModel):
     dates: List[datetime]
     
+class ObservationInput(BaseModel):
+    # Daily observations with the columns of merged_data.csv, in date order
+    observations: List[Dict[str, Any]]
+
 class DateRangeInput(BaseModel):
     startdate: datetime = Field(..., description="Start date in YYYY-MM-DD format")
     enddate: datetime = Field(..., description="End date in YYYY-MM-DD format")
@@ -71,63 +132,366 @@ async def root():
     return {"message": "Welcome to the Weather Forecasting API"}
 
 
+############ Response Cache ############
+
+# Check the client's If-None-Match header against the ETag of a response
+# Only GET and HEAD requests are answered with a 304
+def etag_matches(request, etag):
+    if request.method not in ("GET", "HEAD"):
+        return False
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+# Serve a prediction from the response cache, computing it in the executor on a miss
+# The ETag only depends on the inputs and the serving version, so a client holding
+# a current response gets a 304 without anything being computed
+# The serving version is derived from the model artifacts and the dataset file, so
+# every worker and every restart gives the same ETag for the same data, and a new one
+# as soon as either changes
+# Checking the files for a new version may reload the models or parse the dataset, so
+# it is done in the threadpool; between checks the version is read from memory
+# The computation gets the station's location as its first argument
+async def cached_prediction(request, endpoint, station, compute, *args, log=None):
+    version = station.fresh_version() or await run_in_threadpool(station.version)
+    args = (station.location,) + args
+    key = response_cache.key(compute.__name__, args, version)
+    etag = response_cache.etag(key)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={config.RESPONSE_CACHE_TTL}"}
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    entry = response_cache.get(key, version, scope=station.location)
+    if entry is None:
+        # Concurrent requests for the same prediction share a single computation
+        async def compute_entry():
+            payload = await executor.run(endpoint, compute, *args)
+            return response_cache.put(key, version, payload, scope=station.location)
+
+        entry = await request_flights.run(key, compute_entry)
+
+    if log is not None:
+        log(entry.payload)
+
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+############ Streaming Responses ############
+
+# Stream the response as NDJSON when asked for with ?stream=1 or an Accept header
+def wants_stream(request, stream):
+    return stream or "application/x-ndjson" in request.headers.get("accept", "")
+
+# One NDJSON line, rendered like a JSONResponse body
+def ndjson_line(record):
+    return serialize.dumps(record) + b"\n"
+
+# Dates split into consecutive chunks of STREAM_CHUNK_DAYS
+def date_chunks(dates):
+    for i in range(0, len(dates), config.STREAM_CHUNK_DAYS):
+        yield (dates[i:i + config.STREAM_CHUNK_DAYS],)
+
+# Date range split into consecutive (start, end) chunks of STREAM_CHUNK_DAYS
+def range_chunks(start, end):
+    while start <= end:
+        chunk_end = min(start + timedelta(days=config.STREAM_CHUNK_DAYS - 1), end)
+        yield (start, chunk_end)
+        start = chunk_end + timedelta(days=1)
+
+# Stream the records of a prediction as NDJSON, one line per date
+# Each chunk of dates is computed in the executor only once the previous one has been
+# sent, so memory stays bounded by the chunk size whatever the range
+# The first chunk is computed before responding so that errors still get a status code;
+# an error in a later chunk ends the stream with an {"error": ...} line
+async def streamed_prediction(endpoint, station, compute, field, chunks):
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    records = (await executor.run(endpoint, compute, station.location, *first))[field] if first else []
+
+    async def lines():
+        batch = records
+        while True:
+            for record in batch:
+                yield ndjson_line(record)
+            args = next(chunks, None)
+            if args is None:
+                return
+            try:
+                batch = (await executor.run(endpoint, compute, station.location, *args))[field]
+            except Exception as e:
+                logger.error(f"Error during streamed prediction: {str(e)}")
+                yield ndjson_line({"error": str(e)})
+                return
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# Define a GET endpoint reporting how often concurrent predictions were coalesced
+@app.get("/stats")
+async def stats():
+    return {
+        "singleflight": {
+            request_flights.name: request_flights.stats(),
+            month_flights.name: month_flights.stats(),
+        },
+        "stations": stations.stats(),
+    }
+
+# Serving state exported alongside the latency metrics
+@metrics.register_collector
+def serving_metrics():
+    computations = metrics.Counter('weather_singleflight_computations_total', "Computations started", ['flight'])
+    coalesced = metrics.Counter('weather_singleflight_coalesced_total', "Callers that shared a computation", ['flight'])
+    for flights in (request_flights, month_flights):
+        flight_stats = flights.stats()
+        computations.inc(flights.name, amount=flight_stats["computations"])
+        coalesced.inc(flights.name, amount=flight_stats["coalesced"])
+
+    pending = metrics.Gauge('weather_executor_pending', "Predictions running or queued in the executor")
+    pending.set(value=executor.pending)
+    cached = metrics.Gauge('weather_response_cache_entries', "Responses held in the response cache")
+    cached.set(value=len(response_cache))
+    return [computations, coalesced, pending, cached]
+
+# Define a GET endpoint exposing the metrics in the Prometheus text format
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+############ Response Formats ############
+
+# Shape of the prediction responses, chosen with ?format=
+#   records:  a list with an object per date (and per hour), the default
+#   columnar: parallel arrays of dates, hours and values, built straight from the prediction
+#             arrays; smaller on the wire and cheaper to render for long ranges
+# Streamed responses are always records, one per line
+ResponseFormat = Literal["records", "columnar"]
+
+# Hours of the hourly temperature curves
+HOURS = list(range(25))
+
+
+############ Blocking Prediction Work ############
+
+# These run in the executor, so they are module-level functions taking the station's
+# location rather than the station, and can also be sent to a process pool
+
+# Forecast table covering all the given dates, if there is one for the current models and data
+def precomputed(station, dates):
+    if not config.FORECAST_TABLE:
+        return None
+    table = station.forecast_tables.current(station.version())
+    if table is None or not table.covers(dates):
+        return None
+    return table
+
+# Dates from start to end, one per day
+def date_range(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+# Min, 9am, 3pm and max temperatures and rounded hourly curves of the days from start to end
+def hourly_arrays(station, start, end):
+    dates = date_range(start, end)
+    table = precomputed(station, dates)
+    if table is not None:
+        return dates, table.temps(dates), table.hourly(dates)
+    _, temps, hourly = station.temp_model.predict_hourly_arrays(start, end)
+    return dates, temps, hourly
+
+def columnar_hourly_range(location, start, end):
+    dates, temps, hourly = hourly_arrays(stations.get(location), start, end)
+    return {
+        "dates": dates,
+        "hours": HOURS,
+        "predicted_mintemp": np.round(temps[:, 0], 1),
+        "predicted_maxtemp": np.round(temps[:, 3], 1),
+        "hourly_temperatures": hourly,
+    }
+
+def columnar_hourly(location, target_date):
+    _, temps, hourly = hourly_arrays(stations.get(location), target_date, target_date)
+    return {
+        "date": target_date,
+        "predicted_mintemp": round(temps[0, 0], 1),
+        "predicted_maxtemp": round(temps[0, 3], 1),
+        "hours": HOURS,
+        "hourly_temperatures": hourly[0],
+    }
+
+def compute_hourly_range(location, start, end):
+    # Predict the hourly temperatures for the whole range,
+    # sharing the predictions of neighbouring days
+    return {"hourly_data": stations.get(location).temp_model.predict_hourly_range(start, end)}
+
+def compute_hourly(location, target_date):
+    station = stations.get(location)
+    table = precomputed(station, [target_date])
+    if table is not None:
+        return table.hourly_prediction(target_date)
+
+    # Predict the temperatures of the day, together with the min temperatures
+    # of the day before and after to represent 12am values
+    return station.temp_model.predict_hourly_range(target_date, target_date)[0]
+
+# Min, 9am, 3pm and max temperatures of the dates, one row per date
+def daily_temps(station, dates):
+    # Generate predictions for all dates in the batch/range at once
+    table = precomputed(station, dates)
+    if table is not None:
+        return table.temps(dates)
+    return station.temp_model.predict_batch(dates) if dates else np.empty((0, 4))
+
+def columnar_temp_monthly(location, dates):
+    predictions = daily_temps(stations.get(location), dates)
+    return {
+        "dates": dates,
+        "predicted_mintemp": np.round(predictions[:, 0], 1),
+        "predicted_maxtemp": np.round(predictions[:, 3], 1),
+    }
+
+def compute_temp_monthly(location, dates):
+    predictions = daily_temps(stations.get(location), dates)
+    temp_data = []
+
+    for date, prediction in zip(dates, predictions):
+        # Get min/max temps
+        mintemp = prediction[0]
+        maxtemp = prediction[3]
+
+        # Append structured data to response list
+        temp_data.append({
+            "date": date,
+            "predicted_mintemp": round(mintemp, 1),
+            "predicted_maxtemp": round(maxtemp, 1),
+        })
+
+    return {"temp_data": temp_data}
+
+# Daily rain and monthly total rain of the dates
+def rain_arrays(location, dates):
+    station = stations.get(location)
+    table = precomputed(station, dates)
+    if table is not None and dates:
+        return table.rain(dates), table.month_total(dates)
+
+    # Generate the daily predictions for all dates in the batch/range at once
+    predictions = station.rain_model.predict_batch(dates) if dates else np.empty(0)
+
+    # Calculate the monthly totals once for each distinct month in the batch/range,
+    # sharing them with concurrent requests that need the same month
+    version = station.version()
+    monthly_totals = {}
+    for date in dates:
+        month = (date.year, date.month)
+        if month not in monthly_totals:
+            monthly_totals[month] = month_flights.do((location, month, version),
+                                                     lambda: station.rain_model.total_month(date))
+
+    return predictions, np.array([monthly_totals[(date.year, date.month)] for date in dates])
+
+def columnar_rain(location, dates):
+    predictions, totals = rain_arrays(location, dates)
+    return {
+        "dates": dates,
+        "predicted_rain": np.round(predictions, 1),
+        "predicted_totalrain": np.round(totals, 1),
+    }
+
+def compute_rain(location, dates):
+    predictions, totals = rain_arrays(location, dates)
+    rain_data = [
+        {
+            "date": date,
+            "predicted_rain": round(prediction, 1),
+            "predicted_totalrain": round(total, 1)
+        }
+        for date, prediction, total in zip(dates, predictions, totals)
+    ]
+    return {"rain_data": rain_data}
+
+def compute_weather_counts(location, startdate, enddate):
+    station = stations.get(location)
+    table = precomputed(station, [startdate, enddate])
+    if table is not None:
+        return {"weather_counts": table.weather_counts(startdate, enddate)}
+
+    # Predict the weather types for date range using the model
+    weather_types = station.weather_model.predict(startdate, enddate)
+    # Counted as Python strings, not numpy ones, so the logs show plain names
+    return {"weather_counts": dict(Counter(weather_types.tolist()))}
+
+def compute_weather_types(location, startdate, enddate):
+    station = stations.get(location)
+    dates = date_range(startdate, enddate)
+
+    table = precomputed(station, [startdate, enddate])
+    if table is not None:
+        weather_types = table.weather_types(dates)
+    else:
+        weather_types = station.weather_model.predict(startdate, enddate)
+
+    return {"weather_types": [
+        {"date": date, "weather_type": str(weather_type)}
+        for date, weather_type in zip(dates, weather_types)
+    ]}
+
+
 ############ Hourly Temperature ############
 
+# Define a GET endpoint for predicting the hourly temperature of every day in a date range
+# Registered before /predict/{target_date} so "hourly" is not parsed as a date
+@app.get("/predict/hourly")
+async def predict_temp_hourly_range(start: datetime, end: datetime, request: Request, station: Station = Depends(station_for),
+                                    stream: bool = False, format: ResponseFormat = "records"):
+    if start > end:
+        raise HTTPException(status_code=400, detail="The start date must not be after the end date.")
+    if (end - start).days + 1 > config.HOURLY_RANGE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"The date range must not be longer than {config.HOURLY_RANGE_MAX_DAYS} days.")
+    try:
+        if wants_stream(request, stream):
+            return await streamed_prediction("predict_hourly", station, compute_hourly_range, "hourly_data",
+                                             range_chunks(start, end))
+        compute = columnar_hourly_range if format == "columnar" else compute_hourly_range
+        return await cached_prediction(request, "predict_hourly", station, compute, start, end)
+    except ServiceOverloaded:
+        raise
+    except Exception as e:
+        logger.error(f"Error during prediction: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
 # Define a GET endpoint for predicting hourly temperature
 @app.get("/predict/{target_date}")
-async def predict_temp(target_date: datetime):
+async def predict_temp(target_date: datetime, request: Request, station: Station = Depends(station_for),
+                       format: ResponseFormat = "records"):
     try:
-        # Predict the temperatures using the model
-        mintemp, temp9am, temp3pm, maxtemp = temp_model.predict(target_date)
-
-        # Get the predicted min temperatures of the day before and after
-        # to represent 12am values
-        daybefore = target_date - timedelta(days=1)
-        dayafter = target_date + timedelta(days=1)
-        daybeforetemp = temp_model.predict(daybefore) [0]
-        dayaftertemp = temp_model.predict(dayafter) [0]
-
-        # Generate hourly temperature data
-        hourly_temperatures = temp_model.predict_hourly_temperatures(mintemp, temp9am, temp3pm, maxtemp, daybeforetemp, dayaftertemp)
-        
-        return {
-            "date": target_date,
-            "predicted_mintemp": round(mintemp, 1),
-            "predicted_maxtemp": round(maxtemp, 1),
-            "hourly_temperatures": hourly_temperatures
-        }
+        compute = columnar_hourly if format == "columnar" else compute_hourly
+        return await cached_prediction(request, "predict", station, compute, target_date)
+    except ServiceOverloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
 # Define a POST endpoint for predicting hourly temperature
 @app.post("/predict")
-async def predict_temp(input: PredictionInput):
+async def predict_temp(input: PredictionInput, request: Request, station: Station = Depends(station_for),
+                       format: ResponseFormat = "records"):
     try:
         # Validate target_date through PredictionInput for the initial user input
         validated_input = PredictionInput(target_date=input.target_date)
-        # Predict the temperatures using the model
-        mintemp, temp9am, temp3pm, maxtemp = temp_model.predict(validated_input.target_date)
-
-        # Get the predicted min temperatures of the day before and after
-        # to represent 12am values
-        daybefore = validated_input.target_date - timedelta(days=1)
-        dayafter = validated_input.target_date + timedelta(days=1)
-        daybeforetemp = temp_model.predict(daybefore) [0]
-        dayaftertemp = temp_model.predict(dayafter) [0]
-
-        # Generate hourly temperature data
-        hourly_temperatures = temp_model.predict_hourly_temperatures(mintemp, temp9am, temp3pm, maxtemp, daybeforetemp, dayaftertemp)
-        
-        logger.info(f"Prediction made: {mintemp} - {maxtemp}°C for {validated_input.target_date}")
-        logger.info(f"Prediction for hourly temperature: {hourly_temperatures}")
+
+        def log(prediction):
+            logger.info(f"Prediction made: {prediction['predicted_mintemp']} - {prediction['predicted_maxtemp']}°C for {validated_input.target_date}")
+            logger.info(f"Prediction for hourly temperature: {prediction['hourly_temperatures']}")
 
         # Return the predicted temperatures
-        return {
-            "date": validated_input.target_date,
-            "predicted_mintemp": round(mintemp, 1),
-            "predicted_maxtemp": round(maxtemp, 1),
-            "hourly_temperatures": hourly_temperatures
-        }
+        compute = columnar_hourly if format == "columnar" else compute_hourly
+        return await cached_prediction(request, "predict", station, compute, validated_input.target_date, log=log)
+    except ServiceOverloaded:
+        raise
     except ValueError as e:
         # Handle error if date input is not valid and raise a 400 Internal Server Error
         raise HTTPException(status_code=400, detail=str(e))
@@ -142,25 +506,16 @@ async def predict_temp(input: PredictionInput):
 
 # Define a POST endpoint for predicting monthly min and max temperatures
 @app.post("/predict_temp/monthly")
-async def predict_temp_monthly(input: MonthlyPredictionInput):
+async def predict_temp_monthly(input: MonthlyPredictionInput, request: Request, station: Station = Depends(station_for),
+                               stream: bool = False, format: ResponseFormat = "records"):
     try:
-        temp_data = []
-        
-        # Generate predictions for each date in the batch/range
-        for date in input.dates:
-            # Get min/max temps
-            prediction = temp_model.predict(date)
-            mintemp = prediction[0]
-            maxtemp = prediction[3]
-
-            # Append structured data to response list
-            temp_data.append({
-                "date": date,
-                "predicted_mintemp": round(mintemp, 1),
-                "predicted_maxtemp": round(maxtemp, 1),
-            })
-
-        return {"temp_data": temp_data}
+        if wants_stream(request, stream):
+            return await streamed_prediction("predict_temp_monthly", station, compute_temp_monthly, "temp_data",
+                                             date_chunks(input.dates))
+        compute = columnar_temp_monthly if format == "columnar" else compute_temp_monthly
+        return await cached_prediction(request, "predict_temp_monthly", station, compute, input.dates)
+    except ServiceOverloaded:
+        raise
     except Exception as e:
         # Handle any unexpected errors during prediction and raise a 500 Internal Server Error
         logger.error(f"Error during prediction: {str(e)}")
@@ -172,18 +527,15 @@ async def predict_temp_monthly(input: MonthlyPredictionInput):
 
 # Define a POST endpoint for predicting rain
 @app.post("/predict_rain")
-async def predict_rain(input: MonthlyPredictionInput):
+async def predict_rain(input: MonthlyPredictionInput, request: Request, station: Station = Depends(station_for),
+                       stream: bool = False, format: ResponseFormat = "records"):
     try:
-        # Generate predictions for each month in the batch/range
-        rain_data = [
-            {
-                "date": date,
-                "predicted_rain": round(rain_model.predict(date), 1),
-                "predicted_totalrain": round(rain_model.total_month(date), 1)
-            }
-            for date in input.dates
-        ]
-        return {"rain_data": rain_data}
+        if wants_stream(request, stream):
+            return await streamed_prediction("predict_rain", station, compute_rain, "rain_data", date_chunks(input.dates))
+        compute = columnar_rain if format == "columnar" else compute_rain
+        return await cached_prediction(request, "predict_rain", station, compute, input.dates)
+    except ServiceOverloaded:
+        raise
     except Exception as e:
         # Handle any unexpected errors during prediction and raise a 500 Internal Server Error
         logger.error(f"Error during prediction: {str(e)}")
@@ -195,16 +547,17 @@ async def predict_rain(input: MonthlyPredictionInput):
 
 # Define a GET endpoint for classifying weather types
 @app.get("/predict_weather/{startdate}/{enddate}")
-async def predict_weather(startdate: datetime, enddate: datetime):
+async def predict_weather(startdate: datetime, enddate: datetime, request: Request, station: Station = Depends(station_for),
+                          stream: bool = False):
     try:
-        # Predict the weather types for date range using the model
-        weather_types = weather_model.predict(startdate, enddate)
-        weather_counts = dict(Counter(weather_types))
-
+        # Streamed as the weather type of every date, for the client to count progressively
+        if wants_stream(request, stream):
+            return await streamed_prediction("predict_weather", station, compute_weather_types, "weather_types",
+                                             range_chunks(startdate, enddate))
         # Return the predicted weather types
-        return {
-            "weather_counts": weather_counts
-        }
+        return await cached_prediction(request, "predict_weather", station, compute_weather_counts, startdate, enddate)
+    except ServiceOverloaded:
+        raise
     except Exception as e:
         # Handle any unexpected errors during prediction and raise a 500 Internal Server Error
         logger.error(f"Error during prediction: {str(e)}")
@@ -213,21 +566,24 @@ async def predict_weather(startdate: datetime, enddate: datetime):
 
 # Define a POST endpoint for classifying weather types
 @app.post("/predict_weather")
-async def predict_weather(input: DateRangeInput):
+async def predict_weather(input: DateRangeInput, request: Request, station: Station = Depends(station_for),
+                          stream: bool = False):
     try:
         # Validate start date and end date for the initial user input
         validated_input = DateRangeInput(startdate=input.startdate, enddate=input.enddate)
-        
-        # Predict the weather types for date range using the model
-        weather_types = weather_model.predict(validated_input.startdate, validated_input.enddate)
-        weather_counts = dict(Counter(weather_types))
 
-        logger.info(f"Prediction made: {weather_counts} for {validated_input.startdate} - {validated_input.enddate}")
+        if wants_stream(request, stream):
+            return await streamed_prediction("predict_weather", station, compute_weather_types, "weather_types",
+                                             range_chunks(validated_input.startdate, validated_input.enddate))
+
+        def log(prediction):
+            logger.info(f"Prediction made: {prediction['weather_counts']} for {validated_input.startdate} - {validated_input.enddate}")
 
         # Return the predicted weather types
-        return {
-            "weather_counts": weather_counts
-        }
+        return await cached_prediction(request, "predict_weather", station, compute_weather_counts,
+                                       validated_input.startdate, validated_input.enddate, log=log)
+    except ServiceOverloaded:
+        raise
     except ValueError as e:
         # Handle error if date input is not valid and raise a 400 Internal Server Error
         raise HTTPException(status_code=400, detail=str(e))
@@ -237,6 +593,22 @@ async def predict_weather(input: DateRangeInput):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+############ Observations ############
+
+
+# Define a POST endpoint for adding new daily observations
+# A plain function, so the file appends run in the threadpool instead of on the event loop
+@app.post("/observations")
+def add_observations(input: ObservationInput, station: Station = Depends(station_for)):
+    try:
+        return station.observation_log.append(input.observations)
+    except ValueError as e:
+        # Handle invalid or out of order observations and raise a 400 Bad Request
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error during ingestion: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ingestion error: {str(e)}")
+
 
 if __name__ == "__main__":
     import uvicorn
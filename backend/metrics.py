@@ -0,0 +1,192 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+import config
+
+
+# Lightweight Prometheus-style metrics
+# Spans and request metrics are only recorded when WEATHER_METRICS is on,
+# otherwise span() hands out a shared no-op context manager
+
+ENABLED = config.METRICS
+
+# Latency buckets in seconds, fine enough for the sub-millisecond model stages
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket counts, then the sum and the count of observations
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = self.header()
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {repr(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+stage_seconds = Histogram('weather_stage_seconds', "Time spent in each prediction stage", ['stage'])
+requests_total = Counter('weather_requests_total', "Requests served, by endpoint and status", ['endpoint', 'method', 'status'])
+errors_total = Counter('weather_request_errors_total', "Requests that failed with a 5xx status or an exception", ['endpoint', 'method'])
+in_flight = Gauge('weather_requests_in_flight', "Requests currently being served", ['endpoint'])
+request_seconds = Histogram('weather_request_seconds', "Request latency, by endpoint", ['endpoint', 'method'])
+
+METRICS = [stage_seconds, requests_total, errors_total, in_flight, request_seconds]
+
+# Functions returning extra metrics, rendered on every scrape
+COLLECTORS = []
+
+
+# Timing span around one stage of a prediction
+class Span:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stage_seconds.observe(self.stage, value=time.perf_counter() - self.start)
+        return False
+
+
+_NO_SPAN = nullcontext()
+
+
+def span(stage):
+    return Span(stage) if ENABLED else _NO_SPAN
+
+
+def register_collector(collect):
+    COLLECTORS.append(collect)
+    return collect
+
+
+# Metrics in the Prometheus text exposition format
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collect in COLLECTORS:
+        for metric in collect():
+            lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ASGI middleware counting requests, errors and in-flight requests per endpoint
+# The endpoint is the route's path template, so /predict/2024-01-01 counts as /predict/{target_date}
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    def endpoint(self, scope):
+        from starlette.routing import Match
+
+        router = scope['app'].router if 'app' in scope else None
+        for route in getattr(router, 'routes', []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return 'unmatched'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        endpoint = self.endpoint(scope)
+        method = scope['method']
+        status = {'code': 500}
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        in_flight.inc(endpoint)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            errors_total.inc(endpoint, method)
+            raise
+        else:
+            if status['code'] >= 500:
+                errors_total.inc(endpoint, method)
+        finally:
+            in_flight.dec(endpoint)
+            request_seconds.observe(endpoint, method, value=time.perf_counter() - start)
+            requests_total.inc(endpoint, method, status['code'])
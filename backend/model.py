@@ -1,75 +1,62 @@
 import pandas as pd
 import numpy as np
-import sklearn
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import PolynomialFeatures
 from sklearn.linear_model import Ridge
 from sklearn.metrics import mean_squared_error, r2_score, accuracy_score, classification_report, confusion_matrix
-from sklearn.preprocessing import PolynomialFeatures
 from sklearn.ensemble import RandomForestClassifier
-import joblib
-from datetime import datetime
+from datetime import datetime, timedelta
 from calendar import monthrange
 from scipy.interpolate import CubicSpline
-
-
-### Data Pre-processing for Model Training ###
-
-# Build on the merged dataset from Assignment 2
-# Add more features for an improved model more suitable/appropriate for web deployment
-
-data = pd.read_csv('merged_data.csv')
-
-# Extract Day and Month from Date
-data['Date'] = pd.to_datetime(data.Date, format='%Y-%m-%d')
-data['Day'] = data['Date'].dt.day
-data['Month'] = data['Date'].dt.month
-
-# Add more weather-specific rolling or lagged features
-# Calculate weekly mean
-data['MaxTemp_avg'] = data['MaxTemp'].rolling(7).mean().shift(1)
-data['MinTemp_avg'] = data['MinTemp'].rolling(7).mean().shift(1)
-data['Wind_avg'] = data['MaxWindSpeed'].rolling(7).mean().shift(1)
-data['Cloud_avg'] = (data['9amCloud'] + data['3pmCloud']) / 2
-data['Humidity_avg'] = (data['9amHumidity'] + data['3pmHumidity']) / 2
-
-# Calculate previous day's data
-data['PrevDayWind'] = data['MaxWindSpeed'].shift(1).fillna(0)
-data['PrevDayPrecip'] = data['Precipitation'].shift(1).fillna(0)
-data['PrevDayCloud'] = data['Cloud_avg'].shift(1).fillna(0)
-data['PrevDaySunshine'] = data['Sunshine'].shift(1).fillna(0)
-data['PrevDayHumidity'] = data['Humidity_avg'].shift(1).fillna(0)
-
-# Compare given day's temperature with weekly mean
-data['Week_Day_Max'] = data['MaxTemp_avg'] / data['MaxTemp']
-data['Week_Day_Min'] = data['MinTemp_avg'] / data['MinTemp']
-
-# Drop NaN values and reset index
-data.dropna(inplace=True)
-data.reset_index(drop=True, inplace=True)
-
-# Save updated dataset
-data.to_csv('new_merged_data.csv')
+from joblib import parallel_config
+import config
+from store import feature_store
+from registry import model_registry, save_artifact
+from fastpath import PolyRidge
+from utils import LRUCache
+from metrics import span
+from columnar import load_frame
+
+
+# Split inputs and targets into training and test sets
+# A split computed beforehand (positions of the training and test rows, see pipeline.py)
+# gives the same sets as train_test_split with the same test size
+def split_dataset(X, y, test_size, split=None):
+    if split is None:
+        return train_test_split(X, y, test_size=test_size, random_state=42)
+    train_rows, test_rows = split
+    return X.iloc[train_rows], X.iloc[test_rows], y.iloc[train_rows], y.iloc[test_rows]
 
 
 # Ridge Regression model
 # to predict temperature data for the hourly and monthly temperature charts
 class TempModel:
-    def __init__(self):
+    # Features looked up from the latest observation before the target date
+    STORE_FEATURES = ['MaxTemp_avg', 'MinTemp_avg', 'Wind_avg', 'Week_Day_Max', 'Week_Day_Min']
+
+    # Training inputs, targets and test split
+    INPUTS = ['Day', 'Month', 'MaxTemp_avg', 'MinTemp_avg',  'Wind_avg', 'Week_Day_Max', 'Week_Day_Min']
+    TARGETS = ['MinTemp', '9amTemp', '3pmTemp', 'MaxTemp']
+    TEST_SIZE = 0.2
+
+    def __init__(self, store=feature_store, registry=model_registry):
         # Initialize the model (Ridge Regression with polynomial features)
         self.model = Ridge()
         self.poly = PolynomialFeatures(degree=2)
+        self.store = store
+        self.registry = registry
 
-    def train(self):
+    def train(self, data=None, split=None):
         # Load the dataset
-        data = pd.read_csv('new_merged_data.csv')
+        if data is None:
+            data = load_frame('new_merged_data.csv')
 
         # Select features and target
-        X = data[['Day', 'Month', 'MaxTemp_avg', 'MinTemp_avg',  'Wind_avg', 'Week_Day_Max', 'Week_Day_Min']]  # Input data
-        y = data[['MinTemp', '9amTemp', '3pmTemp', 'MaxTemp']]  # Target variable
+        X = data[self.INPUTS]  # Input data
+        y = data[self.TARGETS]  # Target variable
 
         # Split the data into training and testing sets
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        X_train, X_test, y_train, y_test = split_dataset(X, y, self.TEST_SIZE, split)
 
         # Transform the features into polynomial features
         X_train_poly = self.poly.fit_transform(X_train)
@@ -79,8 +66,8 @@ class TempModel:
         self.model.fit(X_train_poly, y_train)
 
         # Save the model and the polynomial transformer
-        joblib.dump(self.model, 'temp_model.pkl')
-        joblib.dump(self.poly, 'polytemp_transformer.pkl')
+        save_artifact(self.model, 'temp_model.pkl')
+        save_artifact(self.poly, 'polytemp_transformer.pkl')
 
         # Evaluation
         y_pred = self.model.predict(X_test_poly)
@@ -90,72 +77,120 @@ class TempModel:
         print("R^2 Score: %.2f" % r2_score(y_test, y_pred))
     
     def predict(self, target_date):
-        # Prepare the dataset and load the model
-        data = pd.read_csv("new_merged_data.csv")
-        self.model = joblib.load('temp_model.pkl')
-        self.poly = joblib.load('polytemp_transformer.pkl')
-        
-        # Extract day and month from date
-        day = target_date.day
-        month = target_date.month
-
-        # Ensure 'Date' column is in datetime format
-        data['Date'] = pd.to_datetime(data['Date'], format='%Y-%m-%d')
-
-        # Filter data up to the target_date
-        filtered_data = data[data['Date'] < target_date]
-
-        # Extract only the latest values from the filtered data
-        maxtemp_avg = filtered_data['MaxTemp_avg'].iloc[-1]
-        mintemp_avg = filtered_data['MinTemp_avg'].iloc[-1]
-        wind_avg = filtered_data['Wind_avg'].iloc[-1]
-        week_day_max = filtered_data['Week_Day_Max'].iloc[-1]
-        week_day_min = filtered_data['Week_Day_Min'].iloc[-1]
-
-        # Transform the input features into polynomial features
-        X_input_poly = self.poly.transform([[day, month, maxtemp_avg, mintemp_avg, wind_avg, week_day_max, week_day_min]])
-
-        # Model prediction
-        prediction = self.model.predict(X_input_poly)
-
-        return prediction[0]
-
-    def predict_hourly_temperatures(self, min_temp, temp_9am, temp_3pm, max_temp, daybefore, dayafter):
+        return self.predict_batch([target_date])[0]
+
+    # Predict the min, 9am, 3pm and max temperatures for several dates at once
+    # Returns an array with one row per date
+    def predict_batch(self, dates, bundle=None):
+        # Get the loaded model from the registry
+        if bundle is None:
+            bundle = self.registry.current()
+        model = bundle.derived('temp_fast', lambda b: PolyRidge.from_sklearn(b['temp_model'], b['polytemp_transformer']))
+
+        # Extract day and month from each date
+        days = [date.day for date in dates]
+        months = [date.month for date in dates]
+
+        # Extract only the latest values before each date from the feature store
+        with span('store_lookup'):
+            features = self.store.latest_before(dates, self.STORE_FEATURES)
+
+        # Build the whole feature matrix and score it with the compiled polynomial Ridge model
+        X_input = np.column_stack([days, months, features])
+        with span('temp_predict'):
+            return model.predict(X_input)
+
+    # Interpolate the temperature for every hour of the day (0 to 24)
+    def hourly_curve(self, min_temp, temp_9am, temp_3pm, max_temp, daybefore, dayafter):
         # Define the hours and corresponding temperatures
         hours = [0, 6, 9, 15, 18, 25]  # Approximate times for min, 9am, 3pm, max temps
         temperatures = [daybefore, min_temp, temp_9am, temp_3pm, max_temp, dayafter]
 
         # Perform cubic spline interpolation
-        cs = CubicSpline(hours, temperatures)
+        with span('cubic_spline'):
+            cs = CubicSpline(hours, temperatures)
+
+            # Predict hourly temperatures
+            return cs(np.arange(0, 25))
+
+    # Interpolate the hourly curves of several days at once, one row per day
+    # temps has the min, 9am, 3pm and max temperatures of each day, and daybefore/dayafter
+    # the 12am values; a single spline fit over all the days gives the same curves as hourly_curve
+    def hourly_curves(self, temps, daybefore, dayafter):
+        hours = [0, 6, 9, 15, 18, 25]
+        temperatures = np.column_stack([daybefore, temps, dayafter])
+
+        with span('cubic_spline'):
+            cs = CubicSpline(hours, temperatures, axis=1)
+            return cs(np.arange(0, 25))
 
-        # Predict hourly temperatures
-        hourly_hours = np.arange(0, 25)
-        hourly_temperatures = cs(hourly_hours)
+    def predict_hourly_temperatures(self, min_temp, temp_9am, temp_3pm, max_temp, daybefore, dayafter):
+        hourly_temperatures = np.round(self.hourly_curve(min_temp, temp_9am, temp_3pm, max_temp, daybefore, dayafter), 1)
 
         # Return hourly predictions in a dictionary for easy JSON serialization
-        hourly_data = [{"hour": int(hour), "temperature": float(round(temp, 1))} for hour, temp in zip(hourly_hours, hourly_temperatures)]
+        hourly_data = [{"hour": hour, "temperature": temp} for hour, temp in enumerate(hourly_temperatures.tolist())]
         return hourly_data
+
+    # Predict the temperatures of every day from startdate to enddate as arrays:
+    # the dates, the min, 9am, 3pm and max temperatures (one row per day) and the hourly
+    # curves rounded to 1 decimal (one row of 25 hours per day)
+    # Each day is predicted once, and its min temperature is reused as the 12am value
+    # of the days before and after it
+    def predict_hourly_arrays(self, startdate, enddate):
+        daterange = pd.date_range(start=startdate - timedelta(days=1), end=enddate + timedelta(days=1))
+        predictions = self.predict_batch(daterange)
+        hourly = self.hourly_curves(predictions[1:-1], predictions[:-2, 0], predictions[2:, 0])
+        return daterange[1:-1], predictions[1:-1], np.round(hourly, 1)
+
+    # Predict the hourly temperature curve of every day from startdate to enddate
+    def predict_hourly_range(self, startdate, enddate):
+        dates, temps, hourly = self.predict_hourly_arrays(startdate, enddate)
+        mintemps = np.round(temps[:, 0], 1).tolist()
+        maxtemps = np.round(temps[:, 3], 1).tolist()
+
+        return [
+            {
+                "date": date,
+                "predicted_mintemp": mintemp,
+                "predicted_maxtemp": maxtemp,
+                "hourly_temperatures": [{"hour": hour, "temperature": temp} for hour, temp in enumerate(curve)]
+            }
+            for date, mintemp, maxtemp, curve in zip(dates.to_pydatetime(), mintemps, maxtemps, hourly.tolist())
+        ]
     
 
 # Ridge Regression model
 # to predict precipitation data for the monthly total precipitation bar chart    
 class RainModel:
-    def __init__(self):
+    # Features looked up from the latest observation before the target date
+    STORE_FEATURES = ['MinTemp', 'MaxTemp', 'Humidity_avg', 'Cloud_avg', 'PrevDayPrecip', 'PrevDayHumidity']
+
+    # Training inputs, target and test split
+    INPUTS = ['Day', 'Month', 'MinTemp', 'MaxTemp', 'Humidity_avg', 'Cloud_avg', 'PrevDayPrecip', 'PrevDayHumidity']
+    TARGETS = 'Precipitation'
+    TEST_SIZE = 0.3
+
+    def __init__(self, store=feature_store, registry=model_registry, month_cache_size=64):
         # Initialize the model (Ridge Regression with polynomial features)
         self.model = Ridge()
         self.poly = PolynomialFeatures(degree=2)
+        self.store = store
+        self.registry = registry
+
+        # Memoized monthly totals, keyed by (year, month, model version, data version)
+        self.month_totals = LRUCache(maxsize=month_cache_size)
     
-    def train(self):
+    def train(self, data=None, split=None):
         # Load the dataset
-        data = pd.read_csv('new_merged_data.csv')
+        if data is None:
+            data = load_frame('new_merged_data.csv')
 
         # Select features and target
-        X = data[['Day', 'Month', 'MinTemp', 'MaxTemp', 'Humidity_avg', 'Cloud_avg',
-                  'PrevDayPrecip', 'PrevDayHumidity']]  # Input data
-        y = data['Precipitation']  # Target variable
+        X = data[self.INPUTS]  # Input data
+        y = data[self.TARGETS]  # Target variable
 
         # Split the data into training and testing sets
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+        X_train, X_test, y_train, y_test = split_dataset(X, y, self.TEST_SIZE, split)
 
         # Transform the features into polynomial features
         X_train_poly = self.poly.fit_transform(X_train)
@@ -165,8 +200,8 @@ class RainModel:
         self.model.fit(X_train_poly, y_train)
 
         # Save the model and the polynomial transformer
-        joblib.dump(self.model, 'rain_model.pkl')
-        joblib.dump(self.poly, 'polyrain_transformer.pkl')
+        save_artifact(self.model, 'rain_model.pkl')
+        save_artifact(self.poly, 'polyrain_transformer.pkl')
 
         # Evaluation
         y_pred = self.model.predict(X_test_poly)
@@ -176,39 +211,31 @@ class RainModel:
         print("R^2 Score: %.2f" % r2_score(y_test, y_pred))
     
     def predict(self, target_date):
-        # Prepare the dataset and load the model
-        data = pd.read_csv("new_merged_data.csv")
-        self.model = joblib.load('rain_model.pkl')
-        self.poly = joblib.load('polyrain_transformer.pkl')
-        
-        # Extract day, month, and year from date
-        day = target_date.day
-        month = target_date.month
-
-        # Ensure 'Date' column is in datetime format
-        data['Date'] = pd.to_datetime(data['Date'], format='%Y-%m-%d')
+        return self.predict_batch([target_date])[0]
 
-        # Filter data up to the target_date
-        filtered_data = data[data['Date'] < target_date]
+    # Predict the precipitation for several dates at once
+    def predict_batch(self, dates, bundle=None):
+        # Get the loaded model from the registry
+        if bundle is None:
+            bundle = self.registry.current()
+        model = bundle.derived('rain_fast', lambda b: PolyRidge.from_sklearn(b['rain_model'], b['polyrain_transformer']))
 
-        # Extract only the latest values from the filtered data
-        maxtemp = filtered_data['MaxTemp'].iloc[-1]
-        mintemp = filtered_data['MinTemp'].iloc[-1]
-        humidity = filtered_data['Humidity_avg'].iloc[-1]
-        cloud = filtered_data['Cloud_avg'].iloc[-1]
-        prevprecip = filtered_data['PrevDayPrecip'].iloc[-1]
-        prevhumid = filtered_data['PrevDayHumidity'].iloc[-1]
+        # Extract day and month from each date
+        days = [date.day for date in dates]
+        months = [date.month for date in dates]
 
-        # Transform the input features into polynomial features
-        X_input_poly = self.poly.transform([[day, month, mintemp, maxtemp, humidity, cloud, prevprecip, prevhumid]])
+        # Extract only the latest values before each date from the feature store
+        with span('store_lookup'):
+            features = self.store.latest_before(dates, self.STORE_FEATURES)
 
-        # Model prediction
-        prediction = self.model.predict(X_input_poly)
+        # Build the whole feature matrix and score it with the compiled polynomial Ridge model
+        X_input = np.column_stack([days, months, features])
 
-        if (prediction[0] < 0):
-            prediction[0] = 0
+        # Model prediction, negative precipitation is clipped to 0
+        with span('rain_predict'):
+            prediction = model.predict(X_input)
 
-        return prediction[0]
+        return np.maximum(prediction, 0)
     
 
     # Calculate total precipitation amount for the whole month
@@ -222,15 +249,20 @@ class RainModel:
         lastday = monthrange(year, month)[1]
         enddate = datetime(year, month, lastday) 
 
+        # Reuse the total if this month was already computed with the same model and data
+        bundle = self.registry.current()
+        key = (year, month, bundle.version, self.store.version)
+        total = self.month_totals.get(key)
+        if total is not None:
+            return total
+
         # Generate date range
         daterange = pd.date_range(start=startdate, end=enddate)
-        
-        # Calculate total precipitation amount for the whole month
-        total = 0
-        for date in daterange:
-            r_pred = self.predict(date) # Predict the precipitation value for each day
-            total += r_pred
 
+        # Calculate total precipitation amount for the whole month from one batched prediction
+        total = self.predict_batch(daterange, bundle=bundle).sum()
+
+        self.month_totals.put(key, total)
         return total
 
 
@@ -238,29 +270,55 @@ class RainModel:
 # to predict weather data and classify them into weather types within a date range 
 # for the weather type pie chart
 class WeatherTypeModel:
-   def __init__(self):
+   # Features looked up from the latest observation before the target date
+   # (the previous-day inputs are read from the raw columns of that observation)
+   STORE_FEATURES = ['MaxTemp_avg', 'MinTemp_avg', 'Wind_avg', 'Cloud_avg', 'Humidity_avg',
+                     'MaxWindSpeed', 'Cloud_avg', 'Humidity_avg', 'Sunshine', 'Precipitation']
+
+   # Training inputs, target and test split of the classifier
+   INPUTS = ['MaxTemp', 'MinTemp', 'Precipitation', 'MaxWindSpeed', '9amCloud', '3pmHumidity', 'Sunshine']
+   TARGETS = 'WeatherType'
+   TEST_SIZE = 0.2
+
+   # Training inputs, targets and test split of the features model
+   FEATURES_INPUTS = ['Day', 'Month', 'MaxTemp_avg', 'MinTemp_avg', 'Wind_avg', 'Cloud_avg', 'Humidity_avg',
+                      'PrevDayWind', 'PrevDayPrecip', 'PrevDayHumidity', 'PrevDayCloud', 'PrevDaySunshine']
+   FEATURES_TARGETS = ['MaxTemp', 'MinTemp', 'Precipitation', 'MaxWindSpeed', '9amCloud', '3pmHumidity', 'Sunshine']
+   FEATURES_TEST_SIZE = 0.2
+
+   def __init__(self, store=feature_store, registry=model_registry, n_jobs=config.RF_N_JOBS):
       # Initialize the model (Random Forest Classifier)
       self.model = RandomForestClassifier(n_estimators=100, random_state=42)
 
       # Initialize model to get forecasted features (Ridge)
       self.features = Ridge()
 
+      self.store = store
+      self.registry = registry
+
+      # Number of cores used to evaluate the trees when classifying
+      self.n_jobs = n_jobs
+
    # To train random forest classfier model for classifying weather types
-   def train(self):
+   # The trees are built on n_jobs cores (-1 for all cores)
+   def train(self, data=None, split=None, n_jobs=config.TRAIN_JOBS):
       # Load the dataset
-      data = pd.read_csv('new_merged_data.csv')
+      if data is None:
+         data = load_frame('new_merged_data.csv')
 
-      X = data[['MaxTemp', 'MinTemp', 'Precipitation', 'MaxWindSpeed', '9amCloud', '3pmHumidity', 'Sunshine']] # Input data
-      y = data['WeatherType'] # Target
+      X = data[self.INPUTS] # Input data
+      y = data[self.TARGETS] # Target
 
       # Split the data into training and testing sets
-      X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+      X_train, X_test, y_train, y_test = split_dataset(X, y, self.TEST_SIZE, split)
 
-      # Train the model
+      # Train the model, the saved model keeps its default n_jobs
+      self.model.set_params(n_jobs=n_jobs)
       self.model.fit(X_train, y_train)
+      self.model.set_params(n_jobs=None)
 
       # Save the model
-      joblib.dump(self.model, 'randomforest_model.pkl')
+      save_artifact(self.model, 'randomforest_model.pkl')
 
       # Model evaluation
       y_pred = self.model.predict(X_test)
@@ -277,22 +335,22 @@ class WeatherTypeModel:
       print(conf_matrix)
 
    # To train regression model for predicting features data
-   def train_features(self):
-      data = pd.read_csv("new_merged_data.csv")
+   def train_features(self, data=None, split=None):
+      if data is None:
+         data = load_frame("new_merged_data.csv")
 
       # Select features and target
-      X = data[['Day', 'Month', 'MaxTemp_avg', 'MinTemp_avg', 'Wind_avg', 'Cloud_avg', 'Humidity_avg', 
-                'PrevDayWind', 'PrevDayPrecip', 'PrevDayHumidity', 'PrevDayCloud', 'PrevDaySunshine']]  # Input data
-      y = data[['MaxTemp', 'MinTemp', 'Precipitation', 'MaxWindSpeed', '9amCloud', '3pmHumidity', 'Sunshine']]  # Target variable (Features of the RF model)
+      X = data[self.FEATURES_INPUTS]  # Input data
+      y = data[self.FEATURES_TARGETS]  # Target variable (Features of the RF model)
 
       # Split the data into training and testing sets
-      X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+      X_train, X_test, y_train, y_test = split_dataset(X, y, self.FEATURES_TEST_SIZE, split)
 
       # Train the model
       self.features.fit(X_train, y_train)
 
       # Save the model
-      joblib.dump(self.features, 'rf_features_model.pkl')
+      save_artifact(self.features, 'rf_features_model.pkl')
 
       # Model Evaluation
       y_pred = self.features.predict(X_test)
@@ -303,62 +361,52 @@ class WeatherTypeModel:
 
    # To predict features
    def predict_features(self, target_date):
-      # Prepare the dataset and load the model
-      data = pd.read_csv("new_merged_data.csv")
-      self.features = joblib.load('rf_features_model.pkl')
-      
-      # Extract day, month, and year from date
-      day = target_date.day
-      month = target_date.month
-
-      # Ensure 'Date' column is in datetime format
-      data['Date'] = pd.to_datetime(data['Date'], format='%Y-%m-%d')
-
-      # Filter data up to the target_date
-      filtered_data = data[data['Date'] < target_date]
-
-      # Extract only the latest values from the filtered data
-      maxtemp_avg = filtered_data['MaxTemp_avg'].iloc[-1]
-      mintemp_avg = filtered_data['MinTemp_avg'].iloc[-1]
-      wind_avg = filtered_data['Wind_avg'].iloc[-1]
-      cloud_avg = filtered_data['Cloud_avg'].iloc[-1]
-      humidity_avg = filtered_data['Humidity_avg'].iloc[-1]
-      prevwind = filtered_data['MaxWindSpeed'].iloc[-1]
-      prevcloud = filtered_data['Cloud_avg'].iloc[-1]
-      prevhumidity = filtered_data['Humidity_avg'].iloc[-1]
-      prevprecip = filtered_data['Sunshine'].iloc[-1]
-      prevsunshine = filtered_data['Precipitation'].iloc[-1]
-
-      # Model prediction
-      prediction = self.features.predict([[day, month, maxtemp_avg, mintemp_avg, wind_avg, cloud_avg, humidity_avg, prevwind, prevcloud, prevhumidity, prevprecip, prevsunshine]])
-      
-      return prediction[0]
+      return self.predict_features_batch([target_date])[0]
+
+   # To predict features for several dates at once
+   def predict_features_batch(self, dates, bundle=None):
+      # Get the loaded model from the registry
+      if bundle is None:
+         bundle = self.registry.current()
+      features = bundle.derived('features_fast', lambda b: PolyRidge.from_sklearn(b['rf_features_model']))
+
+      # Extract day and month from each date
+      days = [date.day for date in dates]
+      months = [date.month for date in dates]
+
+      # Extract only the latest values before each date from the feature store
+      with span('store_lookup'):
+         latest = self.store.latest_before(dates, self.STORE_FEATURES)
+
+      # Model prediction for the whole feature matrix
+      with span('features_predict'):
+         return features.predict(np.column_stack([days, months, latest]))
    
    # To predict weather types classification of a given date range
    def predict(self, startdate, enddate):
-      # Prepare the dataset and load the model
-      data = pd.read_csv("new_merged_data.csv")
-      self.model = joblib.load('randomforest_model.pkl')
-      self.features = joblib.load('rf_features_model.pkl')
-
-      # Ensure 'Date' column is in datetime format
-      data['Date'] = pd.to_datetime(data['Date'], format='%Y-%m-%d')
+      # Get the loaded model from the registry
+      bundle = self.registry.current()
 
       # Generate date range
       daterange = pd.date_range(start=startdate, end=enddate)
 
-      # Predict the features' values for each date
-      features_predictions = []
-      for date in daterange:
-         f_pred = self.predict_features(date)
-         features_predictions.append(f_pred)
+      # Predict the features' values for all dates in one pass
+      features_predictions = self.predict_features_batch(daterange, bundle=bundle)
+
+      return self.classify(features_predictions, bundle=bundle)
 
-      # Model prediction
-      prediction = self.model.predict(features_predictions)
+   # To classify predicted features into weather types
+   def classify(self, features_predictions, bundle=None):
+      if bundle is None:
+         bundle = self.registry.current()
+      model = bundle['randomforest_model']
 
-      return prediction
+      # Model prediction on the configured number of cores: the pickled forest evaluates
+      # its trees in parallel, the flat export splits the samples between threads
+      with span('forest_predict'), parallel_config(n_jobs=self.n_jobs):
+         return model.predict(features_predictions)
 
 # For initial training
 if __name__ == "__main__":
-    model = TempModel()
-    model.train()
\ No newline at end of file
+    from pipeline import main
+    main()
@@ -0,0 +1,279 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import solve
+from sklearn.base import clone
+from sklearn.linear_model import Ridge
+from sklearn.model_selection import train_test_split
+
+from columnar import load_frame
+from model import TempModel, RainModel, WeatherTypeModel
+from registry import model_registry, save_artifact
+from utils import file_lock, file_sha256, logger
+
+
+# Directory the accumulated statistics are saved to
+STATS_PATH = 'online_stats'
+
+# Ridge models maintained online: (ridge artifact, polynomial artifact, input columns,
+# target columns, test split used by the batch training), taken from the model classes
+# A single target given as a string is fitted as a 1-D target, like in the batch training
+SPECS = {
+    'temp': ('temp_model', 'polytemp_transformer', TempModel.INPUTS, TempModel.TARGETS, TempModel.TEST_SIZE),
+    'rain': ('rain_model', 'polyrain_transformer', RainModel.INPUTS, RainModel.TARGETS, RainModel.TEST_SIZE),
+    'features': ('rf_features_model', None, WeatherTypeModel.FEATURES_INPUTS, WeatherTypeModel.FEATURES_TARGETS,
+                 WeatherTypeModel.FEATURES_TEST_SIZE),
+}
+
+
+# Ridge regression fitted from accumulated sufficient statistics
+# Keeps the means and the centered cross products X'X and X'y, merged batch by batch,
+# so adding rows costs O(n_features^2) per row whatever the amount of history,
+# and solving costs O(n_features^3). The solution is the one of Ridge(alpha) with an
+# unpenalized intercept, fitted on all the rows seen so far
+class OnlineRidge:
+    def __init__(self, n_features, n_targets, alpha=1.0):
+        self.alpha = alpha
+        self.n = 0
+        self.x_mean = np.zeros(n_features)
+        self.y_mean = np.zeros(n_targets)
+        self.xx = np.zeros((n_features, n_features))
+        self.xy = np.zeros((n_features, n_targets))
+
+    # Merge a batch of rows into the statistics
+    def partial_fit(self, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64).reshape(len(X), -1)
+        if len(X) == 0:
+            return self
+
+        batch_x_mean = X.mean(axis=0)
+        batch_y_mean = y.mean(axis=0)
+        X_centered = X - batch_x_mean
+        y_centered = y - batch_y_mean
+
+        # Combine the co-moments of the history and the batch around their new means
+        n = self.n + len(X)
+        delta_x = batch_x_mean - self.x_mean
+        delta_y = batch_y_mean - self.y_mean
+        weight = self.n * len(X) / n
+        self.xx += X_centered.T @ X_centered + weight * np.outer(delta_x, delta_x)
+        self.xy += X_centered.T @ y_centered + weight * np.outer(delta_x, delta_y)
+        self.x_mean += delta_x * len(X) / n
+        self.y_mean += delta_y * len(X) / n
+        self.n = n
+        return self
+
+    # Coefficients (n_targets, n_features) and intercepts (n_targets,)
+    def solve(self):
+        if self.n == 0:
+            raise ValueError("No rows have been added yet")
+        A = self.xx + self.alpha * np.eye(len(self.xx))
+        coef = solve(A, self.xy, assume_a='pos').T
+        intercept = self.y_mean - coef @ self.x_mean
+        return coef, intercept
+
+    # Fitted sklearn Ridge interchangeable with the template the statistics were built for
+    def to_sklearn(self, template):
+        coef, intercept = self.solve()
+        model = clone(template)
+        if np.ndim(template.coef_) == 1:
+            coef, intercept = coef[0], intercept[0]
+        model.coef_ = coef
+        model.intercept_ = intercept
+        model.n_features_in_ = template.n_features_in_
+        if hasattr(template, 'feature_names_in_'):
+            model.feature_names_in_ = template.feature_names_in_
+        return model
+
+    # source_sha256 identifies the artifact the statistics correspond to
+    def save(self, path, source_sha256):
+        tmp_path = f"{path}.tmp.{os.getpid()}.npz"
+        np.savez(tmp_path, n=self.n, alpha=self.alpha, x_mean=self.x_mean, y_mean=self.y_mean,
+                 xx=self.xx, xy=self.xy, source_sha256=source_sha256)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            model = cls(len(arrays['x_mean']), len(arrays['y_mean']), float(arrays['alpha']))
+            model.n = int(arrays['n'])
+            model.x_mean = arrays['x_mean']
+            model.y_mean = arrays['y_mean']
+            model.xx = arrays['xx']
+            model.xy = arrays['xy']
+            return model, str(arrays['source_sha256'])
+
+
+# Keeps the Ridge models up to date with new observations
+# Each batch of ingested rows is added to the statistics, and the refreshed models are
+# solved and published in a background thread; the registry then swaps them in atomically
+# The saved statistics are the shared state of the processes training the same artifacts
+# (the workers of serve.py): each one updates them under a lock file in stats_path, after
+# loading the statistics another process saved, so every publish covers all the rows
+class OnlineTrainer:
+    def __init__(self, registry=model_registry, data_path='new_merged_data.csv', specs=SPECS, stats_path=STATS_PATH):
+        self.registry = registry
+        self.data_path = data_path
+        self.specs = dict(specs)
+        self.stats_path = stats_path
+        self.models = None
+        self._saved = None
+        self._lock = threading.Lock()
+        self._publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='online-train')
+        self._scheduled = False
+
+    def _stats_file(self, name):
+        return os.path.join(self.stats_path, f"{name}.npz")
+
+    # Lock shared with the other processes saving statistics to stats_path
+    def _file_lock(self):
+        os.makedirs(self.stats_path, exist_ok=True)
+        return file_lock(os.path.join(self.stats_path, '.lock'))
+
+    # Modification stamps of the saved statistics, to notice another process saving them
+    def _stamps(self):
+        stamps = {}
+        for name in self.specs:
+            try:
+                stat = os.stat(self._stats_file(name))
+            except FileNotFoundError:
+                continue
+            stamps[name] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    # Save the statistics, tied to the Ridge artifacts they were solved into
+    def _save(self):
+        for name, model in self.models.items():
+            model.save(self._stats_file(name), file_sha256(self.registry.artifacts[self.specs[name][0]]))
+        self._saved = self._stamps()
+
+    # Polynomial expansion of the inputs, if the model has one
+    def _design(self, bundle, name, data):
+        _, poly_name, inputs, _, _ = self.specs[name]
+        X = data[inputs]
+        return bundle[poly_name].transform(X) if poly_name else X.to_numpy(dtype=np.float64)
+
+    # Build the statistics from the training split of the dataset, as the batch training does
+    # Rows from `before` onwards are left out, as they are about to be observed
+    def bootstrap(self, names=None, before=None):
+        bundle = self.registry.reload()
+        data = load_frame(self.data_path)
+        if before is not None:
+            data = data[pd.to_datetime(data['Date']) < before]
+        os.makedirs(self.stats_path, exist_ok=True)
+
+        models = {}
+        for name in names or self.specs:
+            ridge_name, _, inputs, targets, test_size = self.specs[name]
+            X_train, _, y_train, _ = train_test_split(data[inputs], data[targets], test_size=test_size, random_state=42)
+            template = bundle[ridge_name]
+
+            model = OnlineRidge(template.n_features_in_, np.atleast_2d(template.coef_).shape[0], template.alpha)
+            model.partial_fit(self._design(bundle, name, X_train), y_train)
+            model.save(self._stats_file(name), file_sha256(self.registry.artifacts[ridge_name]))
+            models[name] = model
+        return models
+
+    # Load the saved statistics, rebuilding those that do not match the current artifacts
+    def load(self, before=None):
+        models, stale = {}, []
+        for name, (ridge_name, *_) in self.specs.items():
+            try:
+                model, source_sha256 = OnlineRidge.load(self._stats_file(name))
+            except FileNotFoundError:
+                stale.append(name)
+                continue
+            if source_sha256 != file_sha256(self.registry.artifacts[ridge_name]):
+                stale.append(name)
+                continue
+            models[name] = model
+
+        if stale:
+            logger.info(f"Rebuilding online training statistics for {', '.join(stale)}")
+            models.update(self.bootstrap(stale, before))
+        return models
+
+    # Add newly ingested engineered rows and schedule a publish
+    def observe(self, data):
+        if len(data) == 0:
+            return
+        with self._lock, self._file_lock():
+            if self.models is None or self._stamps() != self._saved:
+                self.models = self.load(before=pd.to_datetime(data['Date']).min())
+            bundle = self.registry.current()
+            for name, (_, _, _, targets, _) in self.specs.items():
+                self.models[name].partial_fit(self._design(bundle, name, data), data[targets])
+            self._save()
+
+            if not self._scheduled:
+                self._scheduled = True
+                self._publisher.submit(self.publish)
+
+    # Solve the models, save them as artifacts and reload the registry
+    # Rows observed while publishing schedule another publish
+    def publish(self):
+        try:
+            with self._lock, self._file_lock():
+                self._scheduled = False
+                if self._stamps() != self._saved:
+                    self.models = self.load()
+                bundle = self.registry.current()
+                for name, model in self.models.items():
+                    ridge_name = self.specs[name][0]
+                    save_artifact(model.to_sklearn(bundle[ridge_name]), self.registry.artifacts[ridge_name])
+                self._save()
+            bundle = self.registry.reload()
+            logger.info(f"Published online Ridge models, version {bundle.version}")
+        except Exception as e:
+            logger.error(f"Failed to publish online Ridge models: {str(e)}")
+
+    def shutdown(self, wait=True):
+        self._publisher.shutdown(wait=wait)
+
+
+# Check the bootstrapped statistics against the batch-trained artifacts,
+# and time an update against a full refit as the history grows
+def main():
+    import warnings
+
+    parser = argparse.ArgumentParser(description="Build the online Ridge statistics and compare them with batch training")
+    parser.parse_args()
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+    trainer = OnlineTrainer()
+    models = trainer.bootstrap()
+    bundle = trainer.registry.current()
+    for name, model in models.items():
+        template = bundle[trainer.specs[name][0]]
+        online = model.to_sklearn(template)
+        error = max(np.max(np.abs(online.coef_ - template.coef_)), np.max(np.abs(online.intercept_ - template.intercept_)))
+        print(f"{name}: {model.n} rows, max coefficient difference from the batch fit {error:.2e}")
+
+    data = load_frame(trainer.data_path)
+    _, _, inputs, targets, _ = trainer.specs['temp']
+    X_day = trainer._design(bundle, 'temp', data[inputs].iloc[:1])
+    for years in (1, 10, 40):
+        history = data.loc[data.index.repeat(max(1, years * 365 // len(data)))]
+        X = trainer._design(bundle, 'temp', history[inputs])
+        y = history[targets].to_numpy()
+
+        start = time.perf_counter()
+        Ridge().fit(X, y)
+        refit_time = time.perf_counter() - start
+
+        model = OnlineRidge(X.shape[1], y.shape[1]).partial_fit(X, y)
+        start = time.perf_counter()
+        model.partial_fit(X_day, y[:1])
+        model.solve()
+        update_time = time.perf_counter() - start
+        print(f"~{years} years ({len(X)} rows): full refit {refit_time * 1e3:.2f} ms, online update {update_time * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.model_selection import train_test_split
+
+import config
+from columnar import convert, convert_stale, load_frame
+from features import FEATURES_VERSION, build_features
+import forest
+from registry import ARTIFACTS
+from utils import file_sha256, logger
+
+
+# Source observations the models are trained on
+SOURCE_DATA = 'merged_data.csv'
+
+# Engineered dataset built from the source observations
+TRAINING_DATA = 'new_merged_data.csv'
+
+# Records the fingerprint of the inputs the current artifacts were trained from
+MANIFEST = 'artifacts.json'
+
+
+# Fingerprint of everything the trained artifacts depend on:
+# the source data, the feature engineering code and the sklearn version
+def fingerprint(source=SOURCE_DATA):
+    digest = hashlib.sha256()
+    digest.update(file_sha256(source).encode())
+    digest.update(f"features={FEATURES_VERSION}".encode())
+    digest.update(f"sklearn={sklearn.__version__}".encode())
+    return digest.hexdigest()
+
+
+def load_manifest(path=MANIFEST):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+# Record the fingerprint and the hash of every artifact after training,
+# with the fingerprint of each model's inputs (see train_models)
+def write_manifest(source=SOURCE_DATA, path=MANIFEST, models=None):
+    manifest = {
+        'fingerprint': fingerprint(source),
+        'features_version': FEATURES_VERSION,
+        'sklearn_version': sklearn.__version__,
+        'trained_at': datetime.now().isoformat(timespec='seconds'),
+        'artifacts': {name: file_sha256(file) for name, file in sorted(ARTIFACTS.items())},
+        'models': {name: {'fingerprint': value} for name, value in sorted((models or {}).items())},
+    }
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+    return manifest
+
+
+# Check whether the artifacts on disk were trained from the current inputs
+def artifacts_current(source=SOURCE_DATA, path=MANIFEST):
+    manifest = load_manifest(path)
+    if manifest is None or manifest.get('fingerprint') != fingerprint(source):
+        return False
+
+    for name, file in ARTIFACTS.items():
+        if not os.path.exists(file) or manifest['artifacts'].get(name) != file_sha256(file):
+            return False
+    return True
+
+
+# Models fitted by the training pipeline: name -> (model class, train method, extra train
+# arguments, estimator attributes, input columns, target columns, test size, artifacts written)
+def training_tasks(jobs=config.TRAIN_JOBS):
+    # Imported here so that loading the pipeline does not pull in the models
+    from model import TempModel, RainModel, WeatherTypeModel
+
+    return {
+        'temp': (TempModel, 'train', {}, ['model', 'poly'],
+                 TempModel.INPUTS, TempModel.TARGETS, TempModel.TEST_SIZE,
+                 ['temp_model', 'polytemp_transformer']),
+        'rain': (RainModel, 'train', {}, ['model', 'poly'],
+                 RainModel.INPUTS, RainModel.TARGETS, RainModel.TEST_SIZE,
+                 ['rain_model', 'polyrain_transformer']),
+        'weather': (WeatherTypeModel, 'train', {'n_jobs': jobs}, ['model'],
+                    WeatherTypeModel.INPUTS, WeatherTypeModel.TARGETS, WeatherTypeModel.TEST_SIZE,
+                    ['randomforest_model']),
+        'features': (WeatherTypeModel, 'train_features', {}, ['features'],
+                     WeatherTypeModel.FEATURES_INPUTS, WeatherTypeModel.FEATURES_TARGETS, WeatherTypeModel.FEATURES_TEST_SIZE,
+                     ['rf_features_model']),
+    }
+
+
+# Positions of the training and test rows, shuffled like train_test_split does for any
+# dataset with this many rows
+def split_rows(n_rows, test_size):
+    train_rows, test_rows = train_test_split(np.arange(n_rows), test_size=test_size, random_state=42)
+    return train_rows, test_rows
+
+
+# Fingerprint of everything a model is fitted from: the values of its input and target
+# columns, its training and test rows, its hyperparameters and the sklearn version
+def model_fingerprint(task, data, split):
+    model_class, method, _, estimators, inputs, targets, _, _ = task
+    columns = inputs + ([targets] if isinstance(targets, str) else targets)
+
+    digest = hashlib.sha256()
+    digest.update(f"{model_class.__name__}.{method} {columns}".encode())
+    digest.update(pd.util.hash_pandas_object(data[columns], index=False).to_numpy().tobytes())
+    for rows in split:
+        digest.update(np.asarray(rows, dtype=np.int64).tobytes())
+    model = model_class()
+    for name in estimators:
+        digest.update(f"{name}={sorted(getattr(model, name).get_params().items())}".encode())
+    digest.update(f"sklearn={sklearn.__version__}".encode())
+    return digest.hexdigest()
+
+
+# Check whether a model's artifacts on disk were fitted from the given fingerprint
+def model_current(name, artifacts, value, manifest):
+    if manifest is None or manifest.get('models', {}).get(name, {}).get('fingerprint') != value:
+        return False
+    for artifact in artifacts:
+        file = ARTIFACTS[artifact]
+        if not os.path.exists(file) or manifest['artifacts'].get(artifact) != file_sha256(file):
+            return False
+    return True
+
+
+# Fit one model in a worker process, returning its evaluation report
+# The dataset is mapped from its columnar copy rather than parsed again
+def fit_model(name, split, jobs=config.TRAIN_JOBS, data_path=TRAINING_DATA):
+    model_class, method, options, *_ = training_tasks(jobs)[name]
+    data = load_frame(data_path)
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        getattr(model_class(), method)(data, split, **options)
+    return output.getvalue()
+
+
+# Train the models whose inputs changed since the manifest was written
+# The dataset is loaded and split once; the models are independent, so they are fitted
+# concurrently in a pool of processes, and the forest builds its trees on several cores.
+# Returns the fingerprint of every model and the names of the models that were fitted
+def train_models(data_path=TRAINING_DATA, manifest=None, force=False, jobs=config.TRAIN_JOBS):
+    tasks = training_tasks(jobs)
+    data = load_frame(data_path)
+
+    splits, fingerprints = {}, {}
+    for name, task in tasks.items():
+        test_size = task[6]
+        if test_size not in splits:
+            splits[test_size] = split_rows(len(data), test_size)
+        fingerprints[name] = model_fingerprint(task, data, splits[test_size])
+
+    stale = [name for name, task in tasks.items()
+             if force or not model_current(name, task[7], fingerprints[name], manifest)]
+    skipped = [name for name in tasks if name not in stale]
+    if skipped:
+        logger.info(f"Inputs unchanged, keeping the trained {', '.join(skipped)} models")
+    if not stale:
+        return fingerprints, stale
+
+    cores = (os.cpu_count() or 1) if jobs < 0 else max(jobs, 1)
+    with ProcessPoolExecutor(max_workers=min(len(stale), cores)) as pool:
+        reports = {name: pool.submit(fit_model, name, splits[tasks[name][6]], jobs, data_path) for name in stale}
+        # Print the evaluation reports in a fixed order
+        for report in reports.values():
+            print(report.result(), end='')
+
+    return fingerprints, stale
+
+
+# Materialize the features and train every model whose inputs changed
+def train_all(source=SOURCE_DATA, force=False, jobs=config.TRAIN_JOBS):
+    # Imported here so that loading the pipeline does not pull in the models
+    from online import OnlineTrainer
+
+    build_features(source)
+
+    # Columnar copy of the features, loaded by the training and the feature store
+    convert(TRAINING_DATA)
+
+    models, fitted = train_models(manifest=load_manifest(), force=force, jobs=jobs)
+
+    # Export the forest as memory-mappable arrays for serving
+    if 'weather' in fitted or not os.path.exists(os.path.join(forest.FLAT_FOREST_PATH, 'meta.json')):
+        forest.export()
+
+    # Start the online statistics of the refitted Ridge models from the fresh artifacts
+    OnlineTrainer().load()
+
+    return write_manifest(source, models=models)
+
+
+# Make sure the artifacts are usable when the API starts
+# "load" only uses the pretrained artifacts, "train" retrains them when they are stale
+def prepare(mode='load', source=SOURCE_DATA):
+    if artifacts_current(source):
+        logger.info("Loading pretrained model artifacts")
+        return False
+
+    if mode == 'train':
+        logger.info("Model artifacts are stale, retraining")
+        train_all(source)
+        return True
+
+    logger.warning("Model artifacts do not match the training data, run `python pipeline.py` to retrain them")
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the features and train the weather models")
+    parser.add_argument('--force', action='store_true', help="retrain every model even if the artifacts are up to date")
+    parser.add_argument('--jobs', type=int, default=config.TRAIN_JOBS,
+                        help="cores used for training, -1 for all cores (see WEATHER_TRAIN_JOBS)")
+    args = parser.parse_args()
+
+    if not args.force and artifacts_current():
+        # The features may still have been rewritten since their columnar copy was made
+        if convert_stale(TRAINING_DATA):
+            print(f"Converted {TRAINING_DATA} to the columnar format")
+        print("Model artifacts are up to date")
+        return
+
+    train_all(force=args.force, jobs=args.jobs)
+
+
+if __name__ == "__main__":
+    main()
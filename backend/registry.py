@@ -0,0 +1,161 @@
+import hashlib
+import io
+import os
+import threading
+import time
+
+import joblib
+
+import config
+from forest import FLAT_FOREST_PATH, load_classifier
+from metrics import span
+from utils import logger
+
+
+# Pickled model artifacts served by the API
+ARTIFACTS = {
+    'temp_model': 'temp_model.pkl',
+    'polytemp_transformer': 'polytemp_transformer.pkl',
+    'rain_model': 'rain_model.pkl',
+    'polyrain_transformer': 'polyrain_transformer.pkl',
+    'randomforest_model': 'randomforest_model.pkl',
+    'rf_features_model': 'rf_features_model.pkl',
+}
+
+# Artifacts that are not loaded with joblib.load, as loader(path, content)
+# The forest is served from its memory-mapped flat export when it is up to date
+LOADERS = {'randomforest_model': load_classifier} if config.FLAT_FOREST else {}
+
+# Other files whose changes should trigger a reload
+WATCH = [os.path.join(FLAT_FOREST_PATH, 'meta.json')] if config.FLAT_FOREST else []
+
+
+# Save a model artifact atomically so a reader never picks up a half-written file
+def save_artifact(obj, path):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+# Immutable snapshot of the loaded models, tagged with a content hash
+# A request should take one bundle and use it throughout so it never mixes model versions
+class ModelBundle:
+    def __init__(self, version, models, stamps):
+        self.version = version
+        self.models = models
+        self.stamps = stamps
+        self._derived = {}
+
+    def __getitem__(self, name):
+        try:
+            return self.models[name]
+        except KeyError:
+            raise FileNotFoundError(f"Model artifact '{name}' is not available, train the models first") from None
+
+    # Object derived from the artifacts (e.g. a compiled model), built once per bundle
+    def derived(self, name, build):
+        value = self._derived.get(name)
+        if value is None:
+            value = build(self)
+            self._derived[name] = value
+        return value
+
+
+# Holds the loaded estimators in memory and swaps in new ones when the files change on disk
+class ModelRegistry:
+    def __init__(self, artifacts=ARTIFACTS, loaders=LOADERS, watch=WATCH, check_interval=1.0):
+        self.artifacts = dict(artifacts)
+        self.loaders = dict(loaders)
+        self.watch = list(watch)
+        self.check_interval = check_interval
+        self._bundle = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    # File modification stamps used to detect changed artifacts
+    def _stamps(self):
+        stamps = {}
+        for name, path in list(self.artifacts.items()) + [(path, path) for path in self.watch]:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stamps[name] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def _load(self, stamps):
+        models = {}
+        digest = hashlib.sha256()
+        for name in sorted(self.artifacts):
+            if name not in stamps:
+                continue
+            path = self.artifacts[name]
+            with open(path, 'rb') as f:
+                content = f.read()
+            digest.update(name.encode())
+            digest.update(hashlib.sha256(content).digest())
+
+            loader = self.loaders.get(name)
+            with span('artifact_load'):
+                models[name] = loader(path, content) if loader else joblib.load(io.BytesIO(content))
+        return ModelBundle(digest.hexdigest()[:12], models, stamps)
+
+    def _refresh(self, force=False):
+        stamps = self._stamps()
+        bundle = self._bundle
+        if not force and bundle is not None and stamps == bundle.stamps:
+            return bundle
+
+        try:
+            new_bundle = self._load(stamps)
+        except Exception as e:
+            # Most likely a file that is being replaced, keep serving the current models
+            if bundle is None:
+                raise
+            logger.warning(f"Failed to reload models, keeping version {bundle.version}: {str(e)}")
+            return bundle
+
+        # Only publish the bundle if no file changed while it was being loaded
+        if bundle is not None and new_bundle.stamps != self._stamps():
+            return bundle
+
+        if bundle is not None and new_bundle.version != bundle.version:
+            logger.info(f"Models reloaded: version {bundle.version} -> {new_bundle.version}")
+        self._bundle = new_bundle
+        return new_bundle
+
+    # Get the current bundle, checking the files for changes at most once per check_interval
+    def current(self):
+        bundle = self._bundle
+        now = time.monotonic()
+        if bundle is not None and now < self._next_check:
+            return bundle
+
+        with self._lock:
+            if self._bundle is None or now >= self._next_check:
+                self._refresh()
+                self._next_check = time.monotonic() + self.check_interval
+            return self._bundle
+
+    # The current bundle if it is loaded and not due for a check of the files, otherwise None
+    # Never touches the disk, so it can be called from the event loop
+    def fresh_bundle(self):
+        bundle = self._bundle
+        if bundle is not None and time.monotonic() < self._next_check:
+            return bundle
+        return None
+
+    # Reload the artifacts right away (e.g. after training)
+    def reload(self):
+        with self._lock:
+            bundle = self._refresh(force=True)
+            self._next_check = time.monotonic() + self.check_interval
+            return bundle
+
+    @property
+    def version(self):
+        return self.current().version
+
+
+# Shared registry used by all the models
+model_registry = ModelRegistry()
@@ -0,0 +1,38 @@
+import json
+from datetime import date, datetime
+
+import numpy as np
+
+# orjson is optional, the standard library encoder is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Fast JSON rendering of prediction payloads
+# Produces the same bytes as FastAPI's JSONResponse(jsonable_encoder(payload)) for the
+# payloads of this API (dicts, lists, numbers, strings, datetimes and numpy values)
+# without walking the payload through jsonable_encoder first; numpy arrays are
+# serialized directly instead of as lists of Python floats when orjson is installed
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(payload):
+        return orjson.dumps(payload, default=_default, option=OPTIONS)
+else:
+    def dumps(payload):
+        return json.dumps(payload, default=_default, ensure_ascii=False, allow_nan=False,
+                          separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import time
+
+import config
+from utils import file_sha256, logger
+
+
+# Multi-worker deployment with shared model and dataset memory
+#
+#   python serve.py --workers 4                     # prepare once, then start 4 uvicorn workers
+#   python serve.py --prepare-only                  # prepare for an external process manager, e.g.
+#   WEATHER_PREPARED=1 WEATHER_FORECAST_TABLE_PATH=forecast_table \
+#       gunicorn -k uvicorn.workers.UvicornWorker -w 4 main:app
+#
+# The parent process checks or trains the artifacts, then writes everything large in a
+# memory-mappable form: the columnar copy of every station's dataset, the flat export of
+# every random forest and every station's forecast table. Workers start with
+# WEATHER_PREPARED=1, skip all of that and map the files read-only, so their pages live
+# once in the OS page cache however many workers there are. Only the small Ridge
+# coefficient arrays are loaded per worker. When a forecast table goes stale (the window
+# slid or the data changed), the first worker to notice rebuilds it under a file lock and
+# the others map the new build. Observations may be posted to any worker: they are
+# ingested and trained online under file locks, each worker first catching up with what
+# the others appended (see ObservationLog and OnlineTrainer)
+
+# Default directory of the shared forecast table when none is configured
+FORECAST_TABLE_PATH = 'forecast_table'
+
+
+# Make sure the flat forest export of a station matches its pickled forest
+def prepare_forest(path='.'):
+    import forest
+
+    source = os.path.join(path, 'randomforest_model.pkl')
+    flat_path = os.path.join(path, forest.FLAT_FOREST_PATH)
+    if not os.path.exists(source):
+        return False
+    try:
+        with open(os.path.join(flat_path, 'meta.json')) as f:
+            if json.load(f)['source_sha256'] == file_sha256(source):
+                return False
+    except (FileNotFoundError, KeyError, ValueError):
+        pass
+    forest.export(source, flat_path)
+    return True
+
+
+# Make sure the columnar copy of a station's dataset matches its CSV
+def prepare_dataset(path='.'):
+    import columnar
+
+    return columnar.convert_stale(os.path.join(path, 'new_merged_data.csv'))
+
+
+# Prepare the shared artifacts of every station, returning the environment for the workers
+def prepare_shared(mode=config.BOOT_MODE, forecast_path=None):
+    import pipeline
+    from stations import stations
+
+    start = time.perf_counter()
+    pipeline.prepare(mode)
+
+    for location in stations.available():
+        path = '.' if location == stations.default else stations.station_path(location)
+        converted = prepare_dataset(path)
+        exported = prepare_forest(path)
+        if converted or exported:
+            logger.info(f"Prepared station {location}: dataset {'converted' if converted else 'current'}, "
+                        f"forest {'exported' if exported else 'current'}")
+
+    # The forecast tables are the only derived state large enough to matter per worker,
+    # build every station's once and save them where the workers map them from: the
+    # default station's in forecast_path, the others' in a directory of the same name
+    # inside the station directory (see StationRegistry._open)
+    # Every station's models are loaded in turn to do so, then released
+    forecast_path = forecast_path or config.FORECAST_TABLE_PATH or FORECAST_TABLE_PATH
+    env = {
+        'WEATHER_PREPARED': '1',
+        'WEATHER_COLUMNAR': '1',
+        'WEATHER_FLAT_FOREST': '1',
+        'WEATHER_FORECAST_TABLE_PATH': forecast_path,
+    }
+    if config.FORECAST_TABLE:
+        from forecast_table import ForecastTableManager
+        from stations import Station
+
+        for location in stations.available():
+            if location == stations.default:
+                station, path = stations.default_station, forecast_path
+            else:
+                station = Station(location, stations.station_path(location))
+                path = os.path.join(station.path, os.path.basename(forecast_path))
+            station.load()
+            manager = ForecastTableManager(station.temp_model, station.rain_model, station.weather_model,
+                                           station.registry, station.version, path=path)
+            manager.ensure()
+            if station is not stations.default_station:
+                station.close()
+
+    logger.info(f"Shared artifacts prepared in {time.perf_counter() - start:.1f}s")
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare shared artifacts once and serve the API from several workers")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--mode', default=config.BOOT_MODE, choices=['load', 'train'],
+                        help="what to do when the artifacts are stale (see WEATHER_BOOT_MODE)")
+    parser.add_argument('--prepare-only', action='store_true', help="prepare the shared artifacts and exit")
+    args = parser.parse_args()
+
+    env = prepare_shared(args.mode)
+    if args.prepare_only:
+        for name, value in env.items():
+            print(f"{name}={value}")
+        return
+
+    # The workers are separate processes that inherit this environment
+    os.environ.update(env)
+
+    import uvicorn
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
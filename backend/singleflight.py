@@ -0,0 +1,87 @@
+import asyncio
+import threading
+
+
+# A computation in progress for the synchronous (thread) variant
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Coalesces identical concurrent computations
+# The first caller for a key starts the computation and every caller that arrives
+# while it is still running waits for the same result instead of starting its own
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self.leaders = 0
+        self.followers = 0
+        self._tasks = {}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    # Coroutine variant, fn is a coroutine function
+    # The computation runs as its own task, so a caller that is cancelled
+    # (e.g. the client went away) does not cancel it for the others
+    async def run(self, key, fn):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self._count(leader=True)
+        else:
+            self._count(leader=False)
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._tasks.pop(key, None)
+        # Retrieve the exception so it is not reported as unhandled when every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    # Thread variant, for sub-computations running inside the executor
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        self._count(leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _count(self, leader):
+        with self._lock:
+            if leader:
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+    # How many computations were started and how many callers shared one instead
+    def stats(self):
+        total = self.leaders + self.followers
+        return {
+            "computations": self.leaders,
+            "coalesced": self.followers,
+            "coalesced_ratio": round(self.followers / total, 4) if total else 0.0,
+            "in_flight": len(self._tasks) + len(self._calls),
+        }
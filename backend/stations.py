@@ -0,0 +1,203 @@
+import functools
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import config
+from forecast_table import ForecastTableManager
+from forest import FLAT_FOREST_PATH, load_classifier
+from ingest import ObservationLog
+from model import TempModel, RainModel, WeatherTypeModel
+from online import STATS_PATH, OnlineTrainer
+from pipeline import SOURCE_DATA
+from registry import ARTIFACTS, ModelRegistry, model_registry
+from singleflight import SingleFlight
+from store import FeatureStore, feature_store
+from utils import logger
+
+
+# Station names are used as directory names
+LOCATION_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+# Raised for a location without a station directory, served as a 404
+class UnknownStation(Exception):
+    def __init__(self, location):
+        super().__init__(f"Unknown location: {location}")
+        self.location = location
+
+
+# Dataset, models and derived state of one weather station
+# Every station directory has the same layout as the default station (the backend directory):
+# new_merged_data.csv, merged_data.csv, the pickled artifacts and the flat forest export
+class Station:
+    def __init__(self, location, path, store=None, registry=None, forecast_path=None):
+        self.location = location
+        self.path = path
+
+        self.store = store or FeatureStore(os.path.join(path, 'new_merged_data.csv'))
+        if registry is None:
+            flat_path = os.path.join(path, FLAT_FOREST_PATH)
+            registry = ModelRegistry(
+                artifacts={name: os.path.join(path, file) for name, file in ARTIFACTS.items()},
+                loaders={'randomforest_model': functools.partial(load_classifier, flat_path=flat_path)}
+                if config.FLAT_FOREST else {},
+                watch=[os.path.join(flat_path, 'meta.json')] if config.FLAT_FOREST else [],
+            )
+        self.registry = registry
+
+        self.temp_model = TempModel(self.store, self.registry)
+        self.rain_model = RainModel(self.store, self.registry)
+        self.weather_model = WeatherTypeModel(self.store, self.registry)
+
+        # Predictions precomputed for every day that can be requested
+        self.forecast_tables = ForecastTableManager(self.temp_model, self.rain_model, self.weather_model,
+                                                    self.registry, self.version, path=forecast_path)
+
+        # New observations, refitting the Ridge models online
+        self.observation_log = ObservationLog(os.path.join(path, SOURCE_DATA), self.store)
+        self.online_trainer = OnlineTrainer(self.registry, data_path=self.store.path,
+                                            stats_path=os.path.join(path, STATS_PATH))
+        if config.ONLINE_TRAINING:
+            self.observation_log.listeners.append(self.online_trainer.observe)
+
+    # Version of the models and data the predictions are computed from
+    def version(self):
+        return f"{self.registry.version}.{self.store.version}"
+
+    # Version of the models and data, or None if checking it needs the disk (see version)
+    def fresh_version(self):
+        bundle, snapshot = self.registry.fresh_bundle(), self.store.fresh_snapshot()
+        if bundle is None or snapshot is None:
+            return None
+        return f"{bundle.version}.{snapshot.version}"
+
+    def load(self):
+        self.store.snapshot()
+        self.registry.current()
+        return self
+
+    # Approximate memory held by the station: its dataset columns, its artifacts
+    # (measured by their size on disk) and its forecast table
+    def nbytes(self):
+        total = sum(values.nbytes for values in self.store.snapshot().columns.values())
+        for file in self.registry.artifacts.values():
+            try:
+                total += os.path.getsize(file)
+            except FileNotFoundError:
+                pass
+        table = self.forecast_tables.table
+        if table is not None:
+            total += sum(array.nbytes for array in table.arrays.values())
+        return total
+
+    def close(self):
+        self.online_trainer.shutdown(wait=False)
+
+
+# Stations loaded on first use and evicted least recently used first
+# once their combined memory goes over the budget (the default station is never evicted)
+class StationRegistry:
+    def __init__(self, path=config.STATIONS_PATH, default=config.DEFAULT_STATION, memory_budget=config.STATION_MEMORY_BUDGET):
+        self.path = path
+        self.default = default
+        self.memory_budget = memory_budget
+        self._stations = OrderedDict()
+        self._sizes = {}
+        self._default_station = None
+        self._flights = SingleFlight("stations")
+        self._lock = threading.Lock()
+
+    # The backend directory itself, served through the shared store and registry
+    @property
+    def default_station(self):
+        if self._default_station is None:
+            with self._lock:
+                if self._default_station is None:
+                    self._default_station = Station(self.default, '.', store=feature_store, registry=model_registry,
+                                                    forecast_path=config.FORECAST_TABLE_PATH or None)
+        return self._default_station
+
+    def station_path(self, location):
+        if not LOCATION_PATTERN.match(location):
+            raise UnknownStation(location)
+        path = os.path.join(self.path, location)
+        if not os.path.isdir(path):
+            raise UnknownStation(location)
+        return path
+
+    # Locations that have a station directory
+    def available(self):
+        try:
+            locations = sorted(name for name in os.listdir(self.path) if LOCATION_PATTERN.match(name)
+                               and os.path.isdir(os.path.join(self.path, name)))
+        except FileNotFoundError:
+            locations = []
+        return [self.default] + [location for location in locations if location != self.default]
+
+    # Station for a location, loading it on first use
+    # Concurrent first requests for the same station share a single load
+    def get(self, location=None):
+        if location is None or location == self.default:
+            return self.default_station
+
+        with self._lock:
+            station = self._stations.get(location)
+            if station is not None:
+                self._stations.move_to_end(location)
+                return station
+
+        return self._flights.do(location, lambda: self._open(location))
+
+    def _open(self, location):
+        with self._lock:
+            station = self._stations.get(location)
+        if station is not None:
+            return station
+
+        path = self.station_path(location)
+        forecast_path = os.path.join(path, os.path.basename(config.FORECAST_TABLE_PATH)) if config.FORECAST_TABLE_PATH else None
+        station = Station(location, path, forecast_path=forecast_path).load()
+        size = station.nbytes()
+        with self._lock:
+            self._stations[location] = station
+            # Measure again, forecast tables are built after a station is loaded
+            self._sizes = {name: loaded.nbytes() for name, loaded in self._stations.items()}
+            self._evict(keep=location)
+        logger.info(f"Loaded station {location} ({size / 2 ** 20:.1f} MiB)")
+        return station
+
+    # Drop the least recently used stations until the loaded ones fit in the budget
+    # Requests still holding an evicted station finish with it
+    def _evict(self, keep):
+        while sum(self._sizes.values()) > self.memory_budget and len(self._stations) > 1:
+            location = next(iter(self._stations))
+            if location == keep:
+                self._stations.move_to_end(location)
+                continue
+            station = self._stations.pop(location)
+            self._sizes.pop(location)
+            station.close()
+            logger.info(f"Evicted station {location}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": {location: self._sizes[location] for location in self._stations},
+                "memory_budget": self.memory_budget,
+            }
+
+    def close(self):
+        with self._lock:
+            stations = list(self._stations.values())
+            self._stations.clear()
+            self._sizes.clear()
+        for station in stations:
+            station.close()
+        if self._default_station is not None:
+            self._default_station.online_trainer.shutdown(wait=True)
+
+
+# Shared registry of the stations served by the API
+stations = StationRegistry()
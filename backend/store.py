@@ -0,0 +1,183 @@
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import config
+from columnar import current_columns, load_frame
+from metrics import span
+
+
+# Version of the data in a file, derived from the file's size and modification time
+# rather than counted in memory, so every process serving the same file (workers,
+# restarts) agrees on it and a change to the file always gives a new version
+def data_version(stamp):
+    return hashlib.sha256(repr(stamp).encode()).hexdigest()[:12]
+
+
+# One consistent version of the dataset
+# Replaced as a whole when the data changes so readers never see a mix of old and new columns
+class StoreSnapshot:
+    def __init__(self, dates, columns, version):
+        self.dates = dates
+        self.columns = columns
+        self.version = version
+
+
+# In-memory, date-indexed view of the engineered dataset
+# The CSV is parsed once into contiguous numpy columns so that the models can
+# look up "the latest row before a date" with a binary search instead of
+# re-reading and filtering the whole file on every prediction
+# When its columnar copy (see columnar.py) is up to date, the columns are memory-mapped
+# from it instead of parsing the CSV
+# The file is reloaded when it changes on disk, checked at most once per check_interval
+class FeatureStore:
+    def __init__(self, path='new_merged_data.csv', check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._stamp = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    # File modification stamp used to detect a changed dataset
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return self._stamp
+        return (stat.st_mtime_ns, stat.st_size)
+
+    # Numpy columns of a dataframe or a mapping of arrays, with the numeric ones as float64
+    # (float64 columns of a memory-mapped file are used as they are, without a copy)
+    def _columns(self, data, order=None):
+        columns = {}
+        for name in data.keys():
+            if name == 'Date' or name.startswith('Unnamed'):
+                continue
+            values = np.asarray(data[name])
+            if order is not None:
+                values = values[order]
+            if values.dtype.kind in 'biuf':
+                values = values.astype(np.float64, copy=False)
+            columns[name] = np.ascontiguousarray(values)
+        return columns
+
+    def load(self):
+        stamp = self._file_stamp()
+        with span('dataset_load'):
+            data = current_columns(self.path) if config.COLUMNAR else None
+        if data is None:
+            with span('csv_parse'):
+                data = load_frame(self.path, columnar=False)
+        dates = np.asarray(data['Date'], dtype='datetime64[ns]')
+
+        # Keep the rows sorted by date so the index can be binary searched
+        order = None
+        if len(dates) > 1 and (dates[1:] < dates[:-1]).any():
+            order = np.argsort(dates, kind='stable')
+            dates = dates[order]
+
+        self._snapshot = StoreSnapshot(dates, self._columns(data, order), data_version(stamp))
+        self._stamp = stamp
+
+    # Current snapshot of the data, loading it on first use
+    def snapshot(self):
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now < self._next_check:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is None or (now >= self._next_check and self._file_stamp() != self._stamp):
+                self.load()
+            self._next_check = time.monotonic() + self.check_interval
+            return self._snapshot
+
+    # Snapshot of the file as it is now, reloading it if it changed whatever the check interval
+    def refresh(self):
+        with self._lock:
+            if self._snapshot is None or self._file_stamp() != self._stamp:
+                self.load()
+            self._next_check = time.monotonic() + self.check_interval
+            return self._snapshot
+
+    # The current snapshot if it is loaded and not due for a check of the file, otherwise None
+    # Never touches the disk, so it can be called from the event loop
+    def fresh_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() < self._next_check:
+            return snapshot
+        return None
+
+    # Add engineered rows that were just appended to the file, without re-reading it
+    # The rows must come after the latest date in the store (see check_append)
+    # snapshot is the data the file held before the rows were written, so processes
+    # sharing the file take a lock and refresh() before writing (see ObservationLog.append)
+    # The new version is the one of the file, as a reload would give
+    def append(self, data, snapshot=None):
+        if snapshot is None:
+            snapshot = self.snapshot()
+        with self._lock:
+            dates = self.check_append(data, snapshot)
+
+            added = self._columns(data)
+            columns = {
+                name: np.concatenate([values, added[name].astype(values.dtype, copy=False)])
+                for name, values in snapshot.columns.items()
+            }
+            self._stamp = self._file_stamp()
+            self._snapshot = StoreSnapshot(np.concatenate([snapshot.dates, dates]), columns, data_version(self._stamp))
+            return self._snapshot
+
+    # Check that rows can be appended, returning their dates
+    def check_append(self, data, snapshot=None):
+        if snapshot is None:
+            snapshot = self.snapshot()
+        dates = pd.to_datetime(data['Date']).to_numpy(dtype='datetime64[ns]')
+        if len(dates) and len(snapshot.dates) and dates.min() <= snapshot.dates[-1]:
+            raise ValueError("Appended rows must be later than the latest row in the store")
+        return dates
+
+    @property
+    def dates(self):
+        return self.snapshot().dates
+
+    @property
+    def columns(self):
+        return self.snapshot().columns
+
+    # Changes every time the data changes so dependent caches can be invalidated
+    @property
+    def version(self):
+        return self.snapshot().version
+
+    def __len__(self):
+        return len(self.snapshot().dates)
+
+    # Index of the latest row strictly before each of the given dates
+    def index_before(self, dates, snapshot=None):
+        if snapshot is None:
+            snapshot = self.snapshot()
+        targets = pd.DatetimeIndex(dates).to_numpy(dtype='datetime64[ns]')
+        idx = np.searchsorted(snapshot.dates, targets, side='left') - 1
+        if len(idx) and idx.min() < 0:
+            raise IndexError("No observations available before the requested date")
+        return idx
+
+    # Latest values of the given columns before each date, as an (n_dates, n_columns) matrix
+    def latest_before(self, dates, columns):
+        snapshot = self.snapshot()
+        idx = self.index_before(dates, snapshot)
+        return np.column_stack([snapshot.columns[name][idx] for name in columns])
+
+    # Latest values of the given columns before a single date
+    def latest_row_before(self, date, columns):
+        return self.latest_before([date], columns)[0]
+
+
+# Shared store used by all the models
+feature_store = FeatureStore()
@@ -0,0 +1,89 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import Ridge
+from sklearn.preprocessing import PolynomialFeatures
+
+from fastpath import PolyRidge, compilable
+from registry import ARTIFACTS
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# Ridge fitted on random data, after a polynomial expansion of the given degree (None for none)
+# A single target is fitted as a 1-D target, like RainModel
+def fit(n_features, n_targets, degree=2, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(loc=10.0, scale=5.0, size=(300, n_features))
+    y = X @ rng.normal(size=(n_features, n_targets)) + rng.normal(size=(300, n_targets))
+    if n_targets == 1:
+        y = y[:, 0]
+
+    poly = PolynomialFeatures(degree=degree).fit(X) if degree else None
+    ridge = Ridge().fit(poly.transform(X) if poly else X, y)
+    return X, ridge, poly
+
+
+def sklearn_predict(ridge, poly, X):
+    return ridge.predict(poly.transform(X) if poly else X)
+
+
+@pytest.mark.parametrize("n_features, n_targets, degree", [
+    (7, 4, 2),     # temperatures
+    (8, 1, 2),     # rain
+    (12, 7, None), # forecasted features
+    (5, 2, 1),
+])
+def test_batch_matches_sklearn(n_features, n_targets, degree):
+    X, ridge, poly = fit(n_features, n_targets, degree)
+    compiled = PolyRidge.from_sklearn(ridge, poly)
+
+    expected = sklearn_predict(ridge, poly, X)
+    actual = compiled.predict(X)
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("n_targets", [1, 4])
+def test_single_row_matches_sklearn(n_targets):
+    X, ridge, poly = fit(7, n_targets)
+    compiled = PolyRidge.from_sklearn(ridge, poly)
+
+    expected = sklearn_predict(ridge, poly, X[:1])
+    actual = compiled.predict(X[0])
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_rejects_higher_degrees():
+    _, ridge, poly = fit(3, 1, degree=3)
+    with pytest.raises(ValueError):
+        PolyRidge.from_sklearn(ridge, poly)
+
+
+def test_rejects_wrong_number_of_features():
+    X, ridge, poly = fit(7, 4)
+    with pytest.raises(ValueError):
+        PolyRidge.from_sklearn(ridge, poly).predict(X[:, :6])
+
+
+# The compiled artifacts score the engineered dataset like the sklearn models
+@pytest.mark.filterwarnings("ignore:X does not have valid feature names")
+@pytest.mark.parametrize("name", sorted(compilable()))
+def test_artifacts_match_sklearn(name):
+    ridge_name, poly_name, columns = compilable()[name]
+    paths = [os.path.join(HERE, ARTIFACTS[artifact]) for artifact in (ridge_name, poly_name) if artifact]
+    dataset = os.path.join(HERE, 'new_merged_data.csv')
+    if not all(os.path.exists(path) for path in paths + [dataset]):
+        pytest.skip("trained artifacts are not available")
+
+    ridge = joblib.load(paths[0])
+    poly = joblib.load(paths[1]) if poly_name else None
+    X = pd.read_csv(dataset)[columns].to_numpy(dtype=np.float64)
+
+    expected = sklearn_predict(ridge, poly, X)
+    np.testing.assert_allclose(PolyRidge.from_sklearn(ridge, poly).predict(X), expected, rtol=1e-9, atol=1e-9)
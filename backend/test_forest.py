@@ -0,0 +1,98 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from joblib import parallel_config
+from sklearn.ensemble import RandomForestClassifier
+
+from forest import FlatForest, export, load_classifier
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CLASSES = np.array(['Cloudy', 'Rainy', 'Sunny', 'Windy'])
+
+
+# Forest fitted on random data with text classes, like the weather types,
+# and samples spread over (and past) the training range
+def fit(seed=0, n_estimators=25):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(loc=15.0, scale=8.0, size=(400, 7))
+    y = CLASSES[(X[:, 0] > 15).astype(int) + 2 * (X[:, 2] > 20).astype(int)]
+    forest = RandomForestClassifier(n_estimators=n_estimators, random_state=seed).fit(X, y)
+    samples = np.vstack([X, rng.uniform(X.min(axis=0) - 5, X.max(axis=0) + 5, size=(2000, 7))])
+    return forest, samples
+
+
+def assert_same(flat, forest, X):
+    np.testing.assert_array_equal(flat.predict(X), forest.predict(X))
+    np.testing.assert_allclose(flat.predict_proba(X), forest.predict_proba(X), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_matches_sklearn(seed):
+    forest, X = fit(seed)
+    flat = FlatForest.from_sklearn(forest)
+    assert_same(flat, forest, X)
+    np.testing.assert_array_equal(flat.classes_, forest.classes_)
+
+
+def test_single_sample_matches_sklearn():
+    forest, X = fit()
+    flat = FlatForest.from_sklearn(forest)
+    np.testing.assert_array_equal(flat.predict(X[0]), forest.predict(X[:1]))
+
+
+def test_saved_export_is_memory_mapped(tmp_path):
+    forest, X = fit()
+    FlatForest.from_sklearn(forest).save(str(tmp_path), 'source')
+
+    flat, meta = FlatForest.load(str(tmp_path))
+    assert meta['source_sha256'] == 'source'
+    assert isinstance(flat.feature, np.memmap)
+    assert_same(flat, forest, X)
+
+
+# The registry loader only uses an export made from the same pickle
+def test_loader_checks_the_source(tmp_path):
+    forest, X = fit()
+    source = str(tmp_path / 'randomforest_model.pkl')
+    flat_path = str(tmp_path / 'flat')
+    joblib.dump(forest, source)
+    export(source, flat_path)
+
+    with open(source, 'rb') as f:
+        content = f.read()
+    loaded = load_classifier(source, content, flat_path=flat_path)
+    assert isinstance(loaded, FlatForest)
+    assert_same(loaded, forest, X)
+
+    other, _ = fit(seed=1, n_estimators=5)
+    joblib.dump(other, source)
+    with open(source, 'rb') as f:
+        content = f.read()
+    assert isinstance(load_classifier(source, content, flat_path=flat_path), RandomForestClassifier)
+
+
+# The trained forest classifies the observed weather like its flat export
+@pytest.mark.filterwarnings("ignore:X does not have valid feature names")
+def test_artifact_matches_sklearn():
+    source = os.path.join(HERE, 'randomforest_model.pkl')
+    dataset = os.path.join(HERE, 'new_merged_data.csv')
+    if not (os.path.exists(source) and os.path.exists(dataset)):
+        pytest.skip("trained artifacts are not available")
+
+    forest = joblib.load(source)
+    X = pd.read_csv(dataset)[list(forest.feature_names_in_)].to_numpy(dtype=np.float64)
+    assert_same(FlatForest.from_sklearn(forest), forest, X)
+
+
+# Splitting a batch between threads gives the same classes and probabilities
+def test_threaded_batches_match_sklearn():
+    forest, X = fit()
+    flat = FlatForest.from_sklearn(forest)
+    with parallel_config(n_jobs=3):
+        assert_same(flat, forest, X)
+        np.testing.assert_array_equal(flat.predict_proba(X), flat._predict_proba(X))
@@ -1,8 +1,70 @@
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# fcntl is only available on Unix, files are shared without locking elsewhere
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 def setup_logger():
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
     return logger
 
-logger = setup_logger()
\ No newline at end of file
+logger = setup_logger()
+
+# Small thread-safe LRU mapping with bounded size
+class LRUCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    # Remove the values matching a predicate
+    def discard(self, predicate):
+        with self._lock:
+            for key in [key for key, value in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+# SHA-256 of a file's contents, read in chunks
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Lock on a file shared by several processes (the workers of serve.py), held exclusively
+# to change what the file guards or shared to read it
+@contextmanager
+def file_lock(path, exclusive=True):
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield